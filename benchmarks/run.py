@@ -0,0 +1,240 @@
+"""Timings for reference-data loading, the emissions calculation, ingestion and the dashboard aggregations.
+
+    python -m benchmarks.run --sizes 1k,100k,1m --output results.json
+    python -m benchmarks.run --sizes 10m --distinct-routes 50000 --only engine,dashboard
+
+Business data is synthetic (see benchmarks/synthetic.py) but uses the real airports and classes
+of the workbook, so lookups, distances and unresolved rows behave like production uploads.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from benchmarks.synthetic import parse_size, synthetic_business_data
+from emissions import reference
+from emissions.compact import compact_frame
+from emissions.engine import airport_lookup, calculate_emissions, factor_lookup
+from emissions.ingest import DEFAULT_CHUNKSIZE, iter_csv_chunks, read_csv
+from emissions.rollup import RollupCube, route_labels
+from emissions.routes import RouteIndex
+from emissions.scenarios import BASELINE, Scenario, ScenarioBase, compare_scenarios
+from emissions.streaming import stream_emissions
+from emissions.trails import LEVELS, airport_places, map_layer_data
+
+GROUPS = ["reference", "engine", "ingest", "dashboard"]
+
+
+def measure(function, repeat):
+    # Best and median wall time of `repeat` calls; the last return value is handed back for later stages
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = function()
+        timings.append(time.perf_counter() - started)
+    return timings, value
+
+
+def record(results, group, name, rows, timings):
+    best = min(timings)
+    results.append({
+        "group": group,
+        "name": name,
+        "rows": rows,
+        "repeat": len(timings),
+        "best_s": best,
+        "median_s": statistics.median(timings),
+        "rows_per_s": rows / best if rows and best else None,
+    })
+    print(f"{group:10} {name:34} {rows:>11,} rows {best:9.4f} s", file=sys.stderr)
+
+
+def bench_reference(results, workbook_path, repeat):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        def cold():
+            for path in Path(cache_dir).iterdir():
+                path.unlink()
+            reference.build_cache(workbook_path, cache_dir)
+        record(results, "reference", "build_cache (cold, parses workbook)", 0, measure(cold, repeat)[0])
+        record(results, "reference", "load_airports (mmap cache)", 0,
+               measure(lambda: reference.load_airports(workbook_path, cache_dir), repeat)[0])
+        record(results, "reference", "load_emission_factors (mmap cache)", 0,
+               measure(lambda: reference.load_emission_factors(workbook_path, cache_dir), repeat)[0])
+    # What every page visit cost before the cache
+    record(results, "reference", "read_excel both sheets (no cache)", 0, measure(
+        lambda: pd.read_excel(workbook_path, sheet_name=[spec["sheet_name"] for spec in reference.SHEETS.values()]),
+        1,
+    )[0])
+
+
+def bench_engine(results, business_data, airports, emission_factors, repeat):
+    rows = len(business_data)
+    timings, (processed, _) = measure(lambda: calculate_emissions(business_data, airports, emission_factors), repeat)
+    record(results, "engine", "calculate_emissions", rows, timings)
+
+    routes = RouteIndex(maxsize=max(len(business_data), 1))
+    calculate_emissions(business_data, airports, emission_factors, routes=routes)  # warm the route index
+    timings, _ = measure(lambda: calculate_emissions(business_data, airports, emission_factors, routes=routes), repeat)
+    record(results, "engine", "calculate_emissions (warm routes)", rows, timings)
+
+    # The ellipsoidal kernel is iterative, but only runs once per distinct route
+    timings, _ = measure(lambda: calculate_emissions(business_data, airports, emission_factors, model="vincenty"), repeat)
+    record(results, "engine", "calculate_emissions (vincenty)", rows, timings)
+    return processed
+
+
+def bench_ingest(results, business_data, airports, emission_factors, repeat, chunksize):
+    rows = len(business_data)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "business_data.csv"
+        business_data.to_csv(path, index=False)
+
+        def read_whole():
+            with open(path, "rb") as file:
+                return read_csv(file)
+
+        def read_chunks():
+            with open(path, "rb") as file:
+                for _ in iter_csv_chunks(file, chunksize):
+                    pass
+
+        def stream():
+            with open(path, "rb") as file:
+                return stream_emissions([file], airports, emission_factors, chunksize=chunksize)
+
+        record(results, "ingest", "read_csv", rows, measure(read_whole, repeat)[0])
+        record(results, "ingest", "iter_csv_chunks", rows, measure(read_chunks, repeat)[0])
+        record(results, "ingest", "stream_emissions", rows, measure(stream, repeat)[0])
+
+
+def bench_dashboard(results, processed, coordinates, places, emission_factors, repeat):
+    rows = len(processed)
+    timings, labels = measure(lambda: route_labels(processed), repeat)
+    record(results, "dashboard", "route_labels", rows, timings)
+    processed = processed.assign(Route=labels)
+
+    timings, cube = measure(lambda: RollupCube.from_frame(processed), repeat)
+    record(results, "dashboard", "RollupCube.from_frame", rows, timings)
+    timings, compact = measure(lambda: compact_frame(processed, coordinates), repeat)
+    record(results, "dashboard", "compact_frame", rows, timings)
+
+    # The trail map at each level of detail, from the compact frame the dashboard keeps
+    for level in LEVELS:
+        record(results, "dashboard", f"trail map: {level}", rows,
+               measure(lambda: map_layer_data(compact, coordinates, places, level), repeat)[0])
+
+    # Re-pricing the kept distances under ten factor tables, against the calculation it replaces
+    timings, base = measure(lambda: ScenarioBase(compact), repeat)
+    record(results, "dashboard", "ScenarioBase", rows, timings)
+    factors = factor_lookup(emission_factors)
+    tables = {BASELINE: factors, **{f"x{i}": factors * (1 + i / 100) for i in range(10)}}
+    scenarios = [Scenario(name, name) for name in tables if name != BASELINE]
+    record(results, "dashboard", "compare_scenarios: 10 scenarios", rows,
+           measure(lambda: compare_scenarios(base, scenarios, tables), repeat)[0])
+
+    # The charts on the dashboard tab, answered from the cube and from the rows
+    queries = {
+        "emissions by class": ("Class", "Emissions", "sum"),
+        "top routes": ("Route", "Emissions", "sum"),
+        "median distance by origin": ("Origin", "Distance_km", "median"),
+    }
+    for label, (dimension, measure_column, aggregation) in queries.items():
+        record(results, "dashboard", f"cube: {label}", rows,
+               measure(lambda: cube.aggregate(dimension, measure_column, aggregation), repeat)[0])
+        record(results, "dashboard", f"groupby: {label}", rows, measure(
+            lambda: processed.groupby(dimension, observed=True)[measure_column].agg(aggregation), repeat,
+        )[0])
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="Benchmark the emissions pipeline.")
+    parser.add_argument("--sizes", default="1k,100k,1m", help="Comma-separated row counts, e.g. 1k,100k,1m,10m")
+    parser.add_argument("--distinct-routes", type=int, default=5_000, help="Distinct (origin, destination) pairs the rows repeat")
+    parser.add_argument("--unresolved-share", type=float, default=0.01, help="Share of rows with an unknown airport code")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark; the best is reported")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Rows per chunk for the streaming benchmarks")
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"Comma-separated groups to run ({', '.join(GROUPS)})")
+    parser.add_argument("--workbook", default=reference.WORKBOOK_PATH, type=Path)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", type=Path, help="Write the JSON results here instead of stdout")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    groups = [group.strip() for group in args.only.split(",") if group.strip()]
+    unknown = sorted(set(groups) - set(GROUPS))
+    if unknown:
+        parser.error(f"unknown group(s): {', '.join(unknown)}")
+    try:
+        sizes = [parse_size(size) for size in args.sizes.split(",")]
+    except ValueError:
+        parser.error(f"cannot read --sizes {args.sizes!r}")
+
+    results = []
+    if "reference" in groups:
+        bench_reference(results, args.workbook, args.repeat)
+
+    airports = reference.load_airports(args.workbook)
+    emission_factors = reference.load_emission_factors(args.workbook)
+    coordinates = airport_lookup(airports)
+    places = airport_places(airports, coordinates)
+    for rows in sizes:
+        business_data = synthetic_business_data(
+            rows, airports, emission_factors, distinct_routes=args.distinct_routes,
+            unresolved_share=args.unresolved_share, seed=args.seed,
+        )
+        processed = None
+        if "engine" in groups or "dashboard" in groups:
+            processed = bench_engine(results, business_data, airports, emission_factors, args.repeat) \
+                if "engine" in groups else calculate_emissions(business_data, airports, emission_factors)[0]
+        if "ingest" in groups:
+            bench_ingest(results, business_data, airports, emission_factors, args.repeat, args.chunksize)
+        if "dashboard" in groups:
+            bench_dashboard(results, processed, coordinates, places, emission_factors, args.repeat)
+        del business_data, processed
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "versions": {"pandas": pd.__version__, "numpy": np.__version__, "pyarrow": pa.__version__},
+        "parameters": {
+            "sizes": sizes,
+            "distinct_routes": args.distinct_routes,
+            "unresolved_share": args.unresolved_share,
+            "repeat": args.repeat,
+            "chunksize": args.chunksize,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,108 @@
+"""Cold-start and page-switch timings of the Streamlit app.
+
+    python -m benchmarks.startup --output startup.json
+    python -m benchmarks.startup --app-dir ../business_travel-old   # e.g. a git worktree of an older commit
+
+Every repeat starts a fresh interpreter, so imports and reference tables are loaded from scratch
+exactly as on a newly started server. Pages are run with Streamlit's AppTest: the first run of a
+process is the cold start, later runs of the same page are what a user waits for on a page switch.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+from benchmarks.run import git_commit
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# (label, pages run in order in one fresh process); the first page of each sequence is its cold start
+SEQUENCES = {
+    "open app": ["about.py", "calculator.py", "data.py", "calculator.py", "about.py"],
+    "open calculator": ["calculator.py", "data.py"],
+    "open background data": ["data.py", "calculator.py"],
+}
+
+# Runs in the child interpreter: times each page run and the heavy modules the app has loaded so far
+# (not counting those the test harness itself imports)
+CHILD = """
+import json, os, sys, time
+from streamlit.testing.v1 import AppTest
+
+app_dir, pages = sys.argv[1], sys.argv[2:]
+os.chdir(app_dir)
+sys.path.insert(0, app_dir)
+at = AppTest.from_file(os.path.join(app_dir, "main.py"), default_timeout=300)
+preloaded = set(sys.modules)
+runs = []
+for page in pages:
+    at.switch_page(page)
+    started = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - started
+    if at.exception:
+        raise SystemExit(f"{page}: {at.exception[0].value}")
+    heavy = sorted(
+        m for m in ("pandas", "numpy", "pyarrow", "altair", "pydeck", "plotly") if m in sys.modules and m not in preloaded
+    )
+    runs.append({"page": page, "seconds": elapsed, "modules": heavy})
+print(json.dumps(runs))
+"""
+
+
+def run_sequence(app_dir, pages):
+    completed = subprocess.run(
+        [sys.executable, "-c", CHILD, str(app_dir), *pages], capture_output=True, text=True, cwd=app_dir,
+    )
+    if completed.returncode:
+        raise RuntimeError(f"{' → '.join(pages)} failed: {completed.stderr.strip().splitlines()[-1:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup", description="Time app start and page switches.")
+    parser.add_argument("--app-dir", type=Path, default=ROOT, help="Checkout of the app to time")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh processes per sequence; the best is reported")
+    parser.add_argument("--output", type=Path, help="Write the JSON report here instead of stdout")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    app_dir = args.app_dir.resolve()
+    results = []
+    for label, pages in SEQUENCES.items():
+        repeats = [run_sequence(app_dir, pages) for _ in range(args.repeat)]
+        for step, page in enumerate(pages):
+            timings = [runs[step]["seconds"] for runs in repeats]
+            name = f"{label}: cold {page}" if step == 0 else f"{label}: → {page}"
+            results.append({
+                "sequence": label,
+                "step": step,
+                "page": page,
+                "repeat": len(timings),
+                "best_s": min(timings),
+                "median_s": statistics.median(timings),
+                "modules": repeats[-1][step]["modules"],
+            })
+            print(f"{name:44} {min(timings):8.3f} s  loaded: {', '.join(repeats[-1][step]['modules']) or '-'}",
+                  file=sys.stderr)
+
+    report = {
+        "commit": git_commit(),
+        "app_dir": str(app_dir),
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+RETURN_VALUES = ["Return", "One-Way", None]
+
+
+def parse_size(text):
+    # "1k", "100k", "1m", "10M" or a plain number of rows
+    text = str(text).strip().lower().replace("_", "")
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * multiplier)
+
+
+def synthetic_business_data(rows, airports, emission_factors, distinct_routes=1_000, unresolved_share=0.0,
+                            tags=("Department",), seed=0):
+    """Business travel legs drawn from the real airport Lookups and classes of the workbook.
+
+    `distinct_routes` controls repetition: rows cycle through that many (origin, destination)
+    pairs, skewed so a few routes dominate like real travel data. A share of rows can be given
+    an unknown airport code to exercise the unresolved path.
+    """
+    rng = np.random.default_rng(seed)
+    lookups = airports["Lookup"].drop_duplicates().to_numpy()
+    classes = emission_factors["Class"].to_numpy()
+
+    distinct_routes = max(1, min(distinct_routes, rows))
+    origins = rng.choice(lookups, distinct_routes)
+    destinations = rng.choice(lookups, distinct_routes)
+    # Zipf-like route popularity
+    weights = 1 / np.arange(1, distinct_routes + 1)
+    route = rng.choice(distinct_routes, rows, p=weights / weights.sum())
+
+    frame = pd.DataFrame({
+        "Origin": origins[route],
+        "Destination": destinations[route],
+        "Class": rng.choice(classes, rows),
+        "Num_Passengers": rng.integers(1, 5, rows),
+        "Return_trip": rng.choice(np.array(RETURN_VALUES, dtype=object), rows, p=[0.5, 0.3, 0.2]),
+    })
+    if unresolved_share:
+        unknown = rng.random(rows) < unresolved_share
+        frame.loc[unknown, "Origin"] = "???"
+    for tag in tags:
+        frame[tag] = rng.choice([f"{tag} {i}" for i in range(12)], rows)
+    return frame
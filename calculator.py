@@ -1,86 +1,239 @@
 import streamlit as st
 from pathlib import Path
 import pandas as pd
-import math
-import altair as alt
-import plotly.graph_objects as go
-import numpy as np
-import plotly.express as px
-import pydeck as pdk
-
-
-avarni_file_path = Path(__file__).parent / "data" / "Avarni_Flight-Distance-Emissions-Calculator.xlsm"
-
-@st.cache_data
-def load_airports_raw():
-    return pd.read_excel(avarni_file_path, sheet_name="Airports")
-
-airports = load_airports_raw()
-
-@st.cache_data
-def load_emission_factors_raw():
-    return pd.read_excel(avarni_file_path, sheet_name="Emission Factors")
-
-emission_factors = load_emission_factors_raw()
-
-@st.cache_data
-def load_airports():
-    return pd.read_excel(avarni_file_path, sheet_name="Airports").set_index("Lookup")
+import weakref
+from emissions import profiling
+from emissions.compact import ID_COLUMNS, expand_frame, memory_usage, select_columns
+from emissions.datasets import DEFAULT_MAX_BYTES as DATASET_MAX_BYTES, build_dataset, dataset_bytes, dataset_key
+from emissions.distances import MODELS as DISTANCE_MODELS
+from emissions.engine import OUTPUT_COLUMNS, factor_lookup, unresolved_summary
+from emissions.export import AGGREGATE_MEASURES, FORMATS as EXPORT_FORMATS, export_buffer
+from emissions.ingest import DEFAULT_CHUNKSIZE
+from emissions.parallel import default_workers, merge_streams, stream_files
+from emissions.resolver import DEFAULT_MIN_CONFIDENCE, AirportResolver, read_aliases
+from emissions.results import ResultCache, result_keys
+from emissions.rollup import AGGREGATIONS
+from emissions.routes import open_route_index
+from emissions.scenarios import BASELINE, Scenario, ScenarioBase, compare_scenarios, read_factor_table
+from emissions.store import SharedStore, shared_reference
+from emissions.trails import DEFAULT_LIMIT, LEVELS, map_layer_data
+from emissions.trails import airport_places as place_table
+from emissions.streaming import stream_emissions
+from ui.diagnostics import diagnostics_enabled, diagnostics_panel, record_profile
+from utils.tables import table
+
+
+# Reference tables are held once per process and shared by every session without copying;
+# each is only loaded when a calculation or chart first needs it
+reference_data = shared_reference()
+
+# Shared by every session so distances for known city pairs carry over between uploads; one per distance
+# model and workbook version, since stored distances come from the workbook's coordinates
+@st.cache_resource
+def load_route_index(fingerprint, model):
+    return open_route_index(model=model)
+
+# Processed frames of files already calculated, keyed by their content; only new or changed files are recalculated
+@st.cache_resource
+def load_result_cache():
+    return ResultCache()
+
+result_cache = load_result_cache()
+
+# Calculated datasets shared across sessions: analysts uploading the same files with the same
+# settings see one copy, and each session only keeps its key
+@st.cache_resource
+def load_dataset_store():
+    return SharedStore(DATASET_MAX_BYTES)
+
+dataset_store = load_dataset_store()
+
+# Normalized and trigram index over the Airports sheet, built once per server and workbook version
+@st.cache_resource
+def load_airport_resolver(fingerprint, _airports):
+    return AirportResolver(_airports)
+
+# Country and region of every airport, for the trail map's country and region levels
+@st.cache_resource
+def load_airport_places(fingerprint, _airports, _coordinates):
+    return place_table(_airports, _coordinates)
+
+
+def calculate_dataset(files, keys, workers, resolver, min_confidence, compact, model):
+    return build_dataset(
+        files, result_cache, reference_data.airports, reference_data.emission_factors, reference_data.coordinates,
+        keys=keys, workers=workers, routes=load_route_index(reference_data.fingerprint, model), resolver=resolver, min_confidence=min_confidence, compact=compact, model=model,
+    )
 
-airports_indexed = load_airports()
 
-@st.cache_data
-def load_emission_factors():
-    return pd.read_excel(avarni_file_path, sheet_name="Emission Factors", header=2).set_index("Class")
+def session_dataset():
+    # The dataset of this session's last standard run, recalculated from its uploads if it was evicted
+    inputs = st.session_state.get("dataset")
+    if inputs is None:
+        return None
+    if "dataset" in inputs:
+        return inputs["dataset"]  # larger than the whole store, so this session keeps its own copy
+    return dataset_store.get_or_create(
+        inputs["key"], lambda: calculate_dataset(**{k: v for k, v in inputs.items() if k != "key"})[0], dataset_bytes
+    )
 
-emission_factors_indexed = load_emission_factors()
+def session_scenario_base(business_data):
+    # Class codes and priced passenger-km of the shown dataset, kept until the dataset changes
+    state = st.session_state.get("scenario_base")
+    if state is not None and state["data"]() is business_data:
+        return state["base"]
+    base = ScenarioBase(business_data)
+    st.session_state["scenario_base"] = {"data": weakref.ref(business_data), "base": base}
+    return base
+
+# A starting point for the scenario table; rows sharing a name add further class substitutions
+SCENARIO_TEMPLATE = pd.DataFrame({
+    "Scenario": ["Business as Premium Economy"],
+    "Factor table": [BASELINE],
+    "Scale": [1.0],
+    "Class": ["Business"],
+    "Priced as": ["Premium Economy"],
+    "Drop": [""],
+})
+
+def scenario_list(rows, factor_tables):
+    # Scenarios of the edited table; those naming a factor table that is no longer uploaded are left out
+    scenarios, stale = {}, {}
+    for row in rows.astype(object).where(rows.notna(), None).to_dict("records"):
+        name = (row["Scenario"] or "").strip()
+        if not name:
+            continue
+        if name in stale:
+            continue
+        if name not in scenarios:
+            factors = None if row["Factor table"] in (None, BASELINE) else row["Factor table"]
+            if factors is not None and factors not in factor_tables:
+                stale[name] = factors
+                continue
+            scale = 1.0 if row["Scale"] is None else float(row["Scale"])
+            scenarios[name] = Scenario(name, factors, scale, {}, row["Drop"] or "")
+        if row["Class"] and row["Priced as"]:
+            scenarios[name].substitutions[row["Class"]] = row["Priced as"]
+    if stale:
+        st.warning("Left out scenarios whose factor table is no longer uploaded: " + ", ".join(
+            f"{name} ({table})" for name, table in stale.items()
+        ))
+    return list(scenarios.values())
 
 # template_data = pd.read_excel(avarni_file_path, sheet_name="Flight Calculation Sheet", header=2, index_col=1, usecols="A:E")
 # template_csv = template_data.to_csv(encoding="utf-8")
 sample_data = Path(__file__).parent / "data" / "sample data.csv"
-sample_df = pd.read_csv(sample_data)
-sample_csv = sample_df.to_csv(index=False, encoding="utf-8-sig")
-
-template = pd.DataFrame(columns=["Origin", "Destination", "Class", "Num_Passengers", "Return_trip"])
-template_csv = template.to_csv(index=False, encoding="utf-8-sig")
 
-def get_coordinate(origin, destination):
-    try:
-        origin_row = airports_indexed.loc[[origin]] if origin in airports_indexed.index else None
-        dest_row = airports_indexed.loc[[destination]] if destination in airports_indexed.index else None
-
-        if origin_row is None or dest_row is None:
-            st.error(f"Airport code not found: {origin} or {destination}")
-            return None, None, None, None
-
-        origin_lat = origin_row["Lat"].values[0]
-        origin_lon = origin_row["Lon"].values[0]
-        dest_lat = dest_row["Lat"].values[0]
-        dest_lon = dest_row["Lon"].values[0]
+# The downloads are prepared once per server rather than on every visit to the page
+@st.cache_data
+def sample_csv():
+    return pd.read_csv(sample_data).to_csv(index=False, encoding="utf-8-sig")
 
-        return origin_lat, origin_lon, dest_lat, dest_lon
-    except Exception as e:
-        st.error(f"Error getting coordinates for {origin} → {destination}: {e}")
-        return None, None, None, None
+@st.cache_data
+def template_csv():
+    template = pd.DataFrame(columns=["Origin", "Destination", "Class", "Num_Passengers", "Return_trip"])
+    return template.to_csv(index=False, encoding="utf-8-sig")
+
+def show_unresolved(unresolved_rows, unresolved_values):
+    # One message for all rows that could not be matched, instead of one per row
+    if unresolved_values:
+        st.error(
+            f"{unresolved_rows} rows could not be calculated. Unmatched values: "
+            + "; ".join(
+                f"{column}: " + ", ".join(f"{value} ({count} rows)" for value, count in values.items())
+                for column, values in unresolved_values.items()
+            )
+        )
 
+def show_resolution(report):
+    if report is None or report.empty:
+        return
+    accepted = int(report["Accepted"].sum())
+    with st.expander(
+        f"Airport matching: {accepted} of {len(report)} unknown values matched", icon=":material/travel_explore:"
+    ):
+        st.caption("Values not found in the Airports sheet as entered. Matches below the minimum confidence are only suggestions.")
+        st.dataframe(
+            report,
+            hide_index=True,
+            column_config={"Confidence": st.column_config.ProgressColumn(min_value=0.0, max_value=1.0, format="%.2f")},
+        )
 
-def get_emission_factor(fly_class):
-    try:
-        return emission_factors_indexed.at[fly_class, "Factor CO2e Value"]
-    except KeyError:
-        st.error(f"Invalid class selected: {fly_class}")
-        return None
+def keep_stream(totals, preview, errors, model):
+    # Streaming runs keep only the running totals and a preview; the dashboard reads their cube
+    st.session_state["stream"] = {"totals": totals, "preview": preview, "errors": errors, "model": model}
+    st.session_state["dataset"] = None
+    st.session_state["rollup"] = totals.cube
+
+def show_stream(totals, preview, errors, model):
+    for name, error in errors.items():
+        st.error(f"Could not read {name}: {error}")
+    show_resolution(totals.resolution)
+    show_unresolved(totals.unresolved_rows, totals.unresolved_values)
+
+    st.subheader("Processed Data")
+    st.caption(f"{totals.rows:,} data rows processed in streaming mode, showing the first {len(preview):,}")
+    table(preview, title=None, subtitle=None, key="preview")
+
+def show_dataset(dataset, inputs):
+    for name, error in dataset.errors.items():
+        st.error(f"Could not read {name}: {error}")
+
+    business_data = dataset.business_data
+    if business_data is None:
+        return
+    input_columns = [
+        column for column in business_data.columns
+        if column not in OUTPUT_COLUMNS + list(ID_COLUMNS.values()) + ["Route"]
+    ]
+    for file in inputs["files"]:
+        if file.name in dataset.errors:
+            continue  # skip this file
+        rows = business_data.loc[business_data["filename"] == file.name, input_columns]
+        with profiling.stage("ui.render_file", rows=len(rows)), \
+                st.expander(file.name, icon=":material/description:"):
+            table(rows, title=None, subtitle=None, key=f"file-{file.name}")
+
+    show_resolution(dataset.resolution)
+    show_unresolved(
+        int(dataset.unresolved.any(axis=1).sum()), unresolved_summary(business_data, dataset.unresolved)
+    )
 
+    st.subheader("Processed Data")
+    with profiling.stage("ui.render_processed", rows=len(business_data)):
+        # Coordinates are rebuilt for the visible page only
+        table(
+            business_data, title=None, subtitle=None, key="processed",
+            format_page=lambda page: expand_frame(page, reference_data.coordinates),
+        )
+    if inputs["compact"]:
+        st.caption(
+            f"Stored in compact form: {dataset.full_bytes / 1e6:,.1f} MB → "
+            f"{memory_usage(business_data) / 1e6:,.1f} MB in memory"
+        )
+    store_stats = dataset_store.stats()
+    st.caption(
+        f"Shared dataset store: {store_stats['entries']} datasets, "
+        f"{store_stats['bytes'] / 1e6:,.1f} of {store_stats['max_bytes'] / 1e6:,.0f} MB"
+    )
 
-def calculate_distance(origin_lat, origin_lon, dest_lat, dest_lon, is_return=False):
-    R = 6371  # Radius of Earth in kilometers
-    origin_lat, origin_lon, dest_lat, dest_lon = map(math.radians, [origin_lat, origin_lon, dest_lat, dest_lon])
-    d_lat = dest_lat - origin_lat
-    d_lon = dest_lon - origin_lon
-    a = math.sin(d_lat / 2)**2 + math.cos(origin_lat) * math.cos(dest_lat) * math.sin(d_lon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    distance = R * c
-    return distance * 2 if is_return else distance
+def show_results():
+    # Drawn from the session on every rerun: paging, sorting and searching the tables rerun the
+    # page, and the Calculate button is only pressed on the run that calculated
+    stream, inputs = st.session_state.get("stream"), st.session_state.get("dataset")
+    if stream is not None:
+        show_stream(**stream)
+        model = stream["model"]
+    elif inputs is not None:
+        show_dataset(session_dataset(), inputs)
+        model = inputs["model"]
+    else:
+        return
+    route_stats = load_route_index(reference_data.fingerprint, model).stats()
+    st.caption(
+        f"Route distance cache: {route_stats['hits']} hits, {route_stats['misses']} misses "
+        f"({route_stats['hit_rate']:.0%} hit rate, {route_stats['routes']} {route_stats['model']} routes stored)"
+    )
 
 
 tab1, tab2 = st.tabs(["Upload Data", "Visualize Emissions"])
@@ -90,128 +243,176 @@ with tab1:
     st.caption("Use the template to fill in your data. The template is prefilled with some data already as an example.")
     st.download_button(
         label="Template",
-        data=template_csv,
+        data=template_csv(),
         file_name="business_travel_template.csv",
         type="primary",
         icon=":material/download:"
     )
-    st.download_button("Sample data", sample_csv, file_name="sample data.csv", type="tertiary", icon=":material/download:")
+    st.download_button("Sample data", sample_csv(), file_name="sample data.csv", type="tertiary", icon=":material/download:")
 
     uploaded_files = st.file_uploader(
         label="Upload your business activity file here",
-        type="csv",
+        type=["csv", "parquet"],
         accept_multiple_files=True,
-        help="You can upload multiple files. Make sure columns match the template. Extra columns for tags are fine."
+        help="You can upload multiple CSV or Parquet files. Make sure columns match the template. Extra columns for tags are fine. "
+             "Parquet files, such as a previous export, skip text parsing."
     )
 
+    streaming = st.toggle(
+        "Streaming mode for large files",
+        help="Reads each file in chunks and keeps only running totals, so very large exports fit in memory. "
+             "The trail map and custom charts need the standard mode."
+    )
+    if streaming:
+        chunksize = st.number_input("Rows per chunk", min_value=1_000, value=DEFAULT_CHUNKSIZE, step=10_000)
+    compact = st.toggle(
+        "Compact storage",
+        value=True,
+        help="Keeps the processed data with categorical text columns and airport ids instead of coordinate columns, "
+             "which takes a fraction of the memory."
+    )
+    workers = st.number_input(
+        "Worker processes",
+        min_value=1,
+        max_value=default_workers(),
+        value=1,
+        help="Spread multiple files across processes. Each file is still handled by a single process."
+    )
+    distance_model = st.selectbox(
+        "Distance model",
+        options=list(DISTANCE_MODELS),
+        format_func=DISTANCE_MODELS.get,
+        help="Great-circle distances on a sphere, or geodesic distances on the WGS-84 ellipsoid. "
+             "DEFRA's uplift adds 8% for indirect routing and delays."
+    )
+    resolve = st.toggle(
+        "Match airport names and misspellings",
+        value=True,
+        help="Airports not found as entered are matched by normalized spelling, airport name, your alias table "
+             "and, for near-misses, by similarity."
+    )
+    if resolve:
+        min_confidence = st.slider("Minimum match confidence", min_value=0.5, max_value=1.0, value=DEFAULT_MIN_CONFIDENCE, step=0.05)
+        alias_file = st.file_uploader(
+            "Alias table (optional)",
+            type="csv",
+            help="Two columns without a header: the spelling used in your files and the Airports Lookup it means, "
+                 "one per line, e.g. 'Big Apple,JFK'."
+        )
+
     if uploaded_files:
         if st.button("Calculate emissions", type="primary"):
-            with st.spinner("Please wait while the calculation is running"):
+            with st.spinner("Please wait while the calculation is running"), \
+                    profiling.profile("calculation", trace_memory=diagnostics_enabled()) as profiler:
                 st.session_state["files"] = uploaded_files
-                dataframes = []
-                for file in uploaded_files:
+                route_index = load_route_index(reference_data.fingerprint, distance_model)
+                resolver = None
+                if resolve:
+                    resolver = load_airport_resolver(reference_data.fingerprint, reference_data.airports)
+                    if alias_file is not None:
+                        try:
+                            resolver = resolver.with_aliases(read_aliases(alias_file))
+                        except ValueError as e:
+                            st.error(f"Could not read the alias table: {e}")
+                        for alias, lookup in resolver.invalid_aliases.items():
+                            st.warning(f"Alias {alias} points at {lookup}, which is not in the Airports sheet")
+                if streaming and workers > 1:
+                    results = stream_files(
+                        uploaded_files, chunksize=int(chunksize), workers=int(workers), routes=route_index,
+                        resolver=resolver, min_confidence=min_confidence if resolve else DEFAULT_MIN_CONFIDENCE,
+                        airports=reference_data.airports, emission_factors=reference_data.emission_factors,
+                    )
+                    errors = {result.name: result.error for result in results if result.error is not None}
+                    route_index.save()
+                    keep_stream(*merge_streams(results), errors, distance_model)
+                elif streaming:
+                    progress = st.empty()
+                    rows_read = {}
+
+                    def report_chunk(name, file_format, processed):
+                        rows_read[name] = rows_read.get(name, 0) + len(processed)
+                        progress.caption(f"{name} ({file_format}): {rows_read[name]:,} rows processed")
+
                     try:
-                        file.seek(0)
-                        df = pd.read_csv(file, encoding="utf-8")
-                    except UnicodeDecodeError:
-                        file.seek(0)
-                        df = pd.read_csv(file, encoding="latin1")  # fallback for Excel-exported files
+                        totals, preview = stream_emissions(
+                            uploaded_files, reference_data.airports, reference_data.emission_factors,
+                            routes=route_index, chunksize=int(chunksize), on_chunk=report_chunk,
+                            resolver=resolver, min_confidence=min_confidence if resolve else DEFAULT_MIN_CONFIDENCE
+                        )
                     except Exception as e:
-                        st.error(f"Could not read {file.name}: {e}")
-                        continue  # skip this file
-                    
-                    df['filename'] = file.name  # optional: keep track of which file data came from
-                    dataframes.append(df)
-                    
-                    with st.expander(file.name, icon=":material/description:"):
-                        st.caption(f"{len(df)} rows found)")
-                        st.dataframe(df)
-
-                if dataframes:
-                    business_data = pd.concat(dataframes, ignore_index=True)
-
-                    distances = []
-                    emission_factors_list = []
-                    emissions = []
-                    origin_lats = []
-                    origin_lons = []
-                    dest_lats = []
-                    dest_lons = []
-
-                    for row in business_data.itertuples(index=False):
-                        origin = row.Origin
-                        destination = row.Destination
-                        fly_class = row.Class
-                        row_dict = row._asdict()
-                        num_passengers = row_dict.get("Num_Passengers", 1) or row_dict.get("Num Passengers", 1)
-                        return_val = getattr(row, "Return_trip", "")
-                        is_return = str(return_val).strip().lower() == "return"
-
-                        origin_lat, origin_lon, dest_lat, dest_lon = get_coordinate(origin, destination)
-                        emission_factor = get_emission_factor(fly_class)
-                        origin_lats.append(origin_lat)
-                        origin_lons.append(origin_lon)
-                        dest_lats.append(dest_lat)
-                        dest_lons.append(dest_lon)
-
-                        if all(val is not None and not pd.isna(val) for val in [origin_lat, origin_lon, dest_lat, dest_lon, emission_factor]):
-                            dist = calculate_distance(origin_lat, origin_lon, dest_lat, dest_lon, is_return=is_return)
-                            pkm = dist * num_passengers
-                            emission = pkm * emission_factor
-
-                            distances.append(dist)
-                            emission_factors_list.append(emission_factor)
-                            emissions.append(emission)
-                        else:
-                            distances.append(None)
-                            emission_factors_list.append(None)
-                            emissions.append(None)
-
-                    # ---- Merge additional airport + emissions metadata ----
-
-                    # Airports
-                    airports_origin = airports.rename(columns=lambda x: f"Origin_{x}")
-                    airports_dest = airports.rename(columns=lambda x: f"Destination_{x}")
-
-                    # Emission Factors
-                    business_data["Emission_Factor"] = emission_factors_list
-
-
-                    business_data['Distance_km'] = distances
-                    business_data["Passenger_distance_pkm"] = business_data['Distance_km'] * business_data['Num_Passengers']
-                    business_data["Emissions"] = emissions
-                    business_data["Origin_Lat"] = origin_lats
-                    business_data["Origin_Lon"] = origin_lons
-                    business_data["Destination_Lat"] = dest_lats
-                    business_data["Destination_Lon"] = dest_lons
-
-
-                    st.subheader("Processed Data")
-                    st.caption(f"{len(business_data)} data rows loaded (excluding the header row)")
-                    st.dataframe(business_data)
-                    st.session_state["business_data"] = business_data
-
-
-with tab2:
-
-    if "business_data" in st.session_state and st.session_state["business_data"] is not None:
-        df = st.session_state["business_data"]
+                        st.error(f"Could not read {', '.join(rows_read) or 'the uploaded files'}: {e}")
+                        st.stop()
+                    route_index.save()
+                    keep_stream(totals, preview, {}, distance_model)
+                else:
+                    # Each file keeps its name in the 'filename' column; results come back in upload order
+                    keys = result_keys(uploaded_files, model=distance_model)
+                    inputs = {
+                        "files": uploaded_files,
+                        "keys": keys,
+                        "workers": int(workers),
+                        "resolver": resolver,
+                        "min_confidence": min_confidence if resolve else DEFAULT_MIN_CONFIDENCE,
+                        "compact": compact,
+                        "model": distance_model,
+                    }
+                    dataset_id = dataset_key(
+                        keys, [file.name for file in uploaded_files], compact, resolver, inputs["min_confidence"], distance_model
+                    )
+                    reused = {}
+
+                    def create():
+                        dataset, reused["files"] = calculate_dataset(**inputs)
+                        return dataset
+
+                    with profiling.stage("calculate", bytes=sum(file.size for file in uploaded_files)):
+                        dataset = dataset_store.get_or_create(dataset_id, create, dataset_bytes)
+                    route_index.save()
+                    st.session_state["dataset"] = {"key": dataset_id, **inputs}
+                    if dataset_id not in dataset_store:
+                        st.session_state["dataset"]["dataset"] = dataset
+                    st.session_state["rollup"] = None
+                    st.session_state["stream"] = None
+
+                    if "files" not in reused:
+                        st.caption("These files were already calculated with the same settings; showing the shared results")
+                    elif reused["files"]:
+                        st.caption(f"Reused results for {reused['files']} of {len(uploaded_files)} unchanged files")
+                show_results()
+            record_profile(profiler)
+        else:
+            show_results()
+
+
+with tab2, profiling.profile("dashboard", trace_memory=diagnostics_enabled()) as dashboard_profiler:
+
+    dataset = session_dataset()
+    if dataset is not None:
+        df, cube = dataset.business_data, dataset.rollup
+    else:
+        df, cube = None, st.session_state.get("rollup")
+
+    if cube is not None:
+        # Everything except the map and scatter plot reads the rollup cube built after calculation, not the rows.
+        # The chart libraries are only imported once there is something to draw
+        import altair as alt
+        import pydeck as pdk
 
         st.write("""#### Summary Statistics""")
         with st.container(border=True):
             col1, col2, col3 = st.columns([0.1,0.1, 0.1])
             with col1:
-                st.metric("Total Emissions (kg CO₂e)", f"{df['Emissions'].sum():,.2f}")
+                st.metric("Total Emissions (kg CO₂e)", f"{cube.total('Emissions'):,.2f}")
             with col2:
-                st.metric("Total Distance (km)", f"{df['Distance_km'].sum():,.2f}")
+                st.metric("Total Distance (km)", f"{cube.total('Distance_km'):,.2f}")
             with col3:
-                st.metric("Total Passenger Distance (pkm)", f"{df['Passenger_distance_pkm'].sum():,.2f}")
+                st.metric("Total Passenger Distance (pkm)", f"{cube.total('Passenger_distance_pkm'):,.2f}")
 
 
         col1, col2 = st.columns([0.1,0.1])    
         with col1:
             """#### Emissions by Class (Pie Chart)"""
-            pie_data = df.groupby("Class")["Emissions"].sum().reset_index()
+            pie_data = cube.aggregate("Class", "Emissions", "sum").reset_index()
             pie_chart = alt.Chart(pie_data).mark_arc(innerRadius=40).encode(
                 theta=alt.Theta(field="Emissions", type="quantitative"),
                 color=alt.Color(field="Class", type="nominal"),
@@ -222,120 +423,258 @@ with tab2:
         
         with col2:
             """#### Emissions by Route (Top 10)"""
-            df["Route"] = df["Origin"] + " ➝ " + df["Destination"]
-            st.bar_chart(df.groupby("Route")["Emissions"].sum().sort_values(ascending=False).head(10))
+            st.bar_chart(cube.aggregate("Route", "Emissions", "sum").sort_values(ascending=False).head(10))
 
 # Geomap for plotting flight paths
         st.divider()
         st.write("""#### Emissions Trail Map""")
 
-        map_df = df.dropna(subset=["Origin", "Destination", "Origin_Lat", "Origin_Lon", "Destination_Lat", "Destination_Lon", "Emissions"])
-        agg_map = map_df.groupby(
-            ["Origin", "Destination", "Origin_Lon", "Origin_Lat", "Destination_Lon", "Destination_Lat"],
-            as_index=False
-        ).agg({"Emissions": "sum"})
-
-        # Normalize emission width
-        def normalize(val):
-            min_val = agg_map["Emissions"].min()
-            max_val = agg_map["Emissions"].max()
-            return 1 + 5 * (val - min_val) / (max_val - min_val) if max_val > min_val else 2
-
-        agg_map["width"] = agg_map["Emissions"].apply(normalize)
-        agg_map["Emissions_str"] = agg_map["Emissions"].apply(lambda x: f"{x:.4f}")
-
-        # Use ArcLayer for smooth curves
-        arc_layer = pdk.Layer(
-            "ArcLayer",
-            data=agg_map,
-            get_source_position=["Origin_Lon", "Origin_Lat"],
-            get_target_position=["Destination_Lon", "Destination_Lat"],
-            get_source_color=[0, 200, 255, 80],
-            get_target_color=[255, 100, 100, 80],
-            get_width="width",
-            width_scale=1,
-            pickable=True,
-            auto_highlight=True,
-        )
+        if df is None:
+            st.info("The emissions trail map needs row-level data. Run the calculation without streaming mode to see it.")
+        else:
+            col1, col2 = st.columns([0.2, 0.1])
+            with col1:
+                level = st.radio(
+                    "Level of detail", options=list(LEVELS), format_func=LEVELS.get, horizontal=True,
+                    help="Country and region arcs join the emission-weighted centres of the airports used. "
+                         "Hotspots show the emissions of flights to or from each airport.",
+                )
+            with col2:
+                limit = st.number_input("Most emitting features to draw", min_value=10, max_value=5_000, value=DEFAULT_LIMIT, step=50)
+            airport_places = load_airport_places(reference_data.fingerprint, reference_data.airports, reference_data.coordinates)
+            with profiling.stage("dashboard.map", rows=len(df)):
+                agg_map, map_summary = map_layer_data(df, reference_data.coordinates, airport_places, level, int(limit))
+            if map_summary["features"] > map_summary["shown"]:
+                st.caption(
+                    f"Showing the {map_summary['shown']:,} largest of {map_summary['features']:,}, "
+                    f"{map_summary['shown_emissions'] / map_summary['emissions']:.1%} of their emissions"
+                )
 
-        # Define map center
-        view_state = pdk.ViewState(
-            latitude=agg_map["Origin_Lat"].mean(),
-            longitude=agg_map["Origin_Lon"].mean(),
-            zoom=2,
-            pitch=30,
-            bearing=0
-        )
+            if level == "hotspots":
+                layer = pdk.Layer(
+                    "ScatterplotLayer",
+                    data=agg_map,
+                    get_position=["Lon", "Lat"],
+                    get_radius="radius",
+                    get_fill_color=[255, 100, 100, 140],
+                    pickable=True,
+                    auto_highlight=True,
+                )
+                center_lat, center_lon = agg_map["Lat"].mean(), agg_map["Lon"].mean()
+                tooltip_html = "<b>Airport:</b> {Airport}<br/><b>Emissions to or from:</b> {Emissions_str} kg CO₂e"
+            else:
+                # Use ArcLayer for smooth curves
+                layer = pdk.Layer(
+                    "ArcLayer",
+                    data=agg_map,
+                    get_source_position=["Origin_Lon", "Origin_Lat"],
+                    get_target_position=["Destination_Lon", "Destination_Lat"],
+                    get_source_color=[0, 200, 255, 80],
+                    get_target_color=[255, 100, 100, 80],
+                    get_width="width",
+                    width_scale=1,
+                    pickable=True,
+                    auto_highlight=True,
+                )
+                center_lat, center_lon = agg_map["Origin_Lat"].mean(), agg_map["Origin_Lon"].mean()
+                tooltip_html = "<b>Route:</b> {Origin} ➔ {Destination}<br/><b>Emissions:</b> {Emissions_str} kg CO₂e"
+
+            # Define map center
+            view_state = pdk.ViewState(
+                latitude=center_lat,
+                longitude=center_lon,
+                zoom=2,
+                pitch=30,
+                bearing=0
+            )
 
-        # Tooltip styling
-        tooltip = {
-            "html": "<b>Route:</b> {Origin} ➔ {Destination}<br/><b>Emissions:</b> {Emissions_str} kg CO₂e",
-            "style": {
-                "backgroundColor": "rgba(255, 255, 255, 0.9)",
-                "color": "#333",
-                "fontSize": "12px",
-                "padding": "8px",
-                "borderRadius": "4px"
+            # Tooltip styling
+            tooltip = {
+                "html": tooltip_html,
+                "style": {
+                    "backgroundColor": "rgba(255, 255, 255, 0.9)",
+                    "color": "#333",
+                    "fontSize": "12px",
+                    "padding": "8px",
+                    "borderRadius": "4px"
+                }
             }
-        }
 
 
-        # Use modern mapbox style (lightweight)
-        st.pydeck_chart(pdk.Deck(
-            map_style="mapbox://styles/mapbox/light-v11",
-            layers=[arc_layer],
-            initial_view_state=view_state,
-            tooltip=tooltip
-        ))
+            # Use modern mapbox style (lightweight)
+            st.pydeck_chart(pdk.Deck(
+                map_style="mapbox://styles/mapbox/light-v11",
+                layers=[layer],
+                initial_view_state=view_state,
+                tooltip=tooltip
+            ))
 
         st.divider()
-        
+        st.write("""#### Scenarios""")
+
+        if df is None:
+            st.info("Scenarios re-price the rows of the last calculation. Run the calculation without streaming mode to use them.")
+        else:
+            st.caption(
+                "Re-prices the distances of the last calculation under other emission factors, class changes "
+                "or dropped routes. Nothing is recalculated, so scenarios update instantly."
+            )
+            factor_files = st.file_uploader(
+                "Alternative emission factor tables", type=["csv", "xlsx"], accept_multiple_files=True,
+                help="Laid out like the Emission Factors sheet: a Class column and a Factor CO2e Value column "
+                     "(kg CO₂e per passenger-km), e.g. another DEFRA year or factors without radiative forcing.",
+            )
+            factor_tables = {BASELINE: factor_lookup(reference_data.emission_factors)}
+            for factor_file in factor_files or []:
+                try:
+                    factor_tables[factor_file.name] = read_factor_table(factor_file)
+                except ValueError as e:
+                    st.error(f"Could not read the factor table {factor_file.name}: {e}")
+
+            classes = sorted(set().union(*(factors.index for factors in factor_tables.values())))
+            scenario_rows = st.data_editor(
+                SCENARIO_TEMPLATE,
+                num_rows="dynamic",
+                hide_index=True,
+                use_container_width=True,
+                key="scenarios",
+                column_config={
+                    "Scenario": st.column_config.TextColumn(help="Rows with the same name make one scenario"),
+                    "Factor table": st.column_config.SelectboxColumn(options=list(factor_tables), default=BASELINE),
+                    "Scale": st.column_config.NumberColumn(
+                        min_value=0.0, default=1.0, format="%.3f", help="Multiplies every factor of the table"
+                    ),
+                    "Class": st.column_config.SelectboxColumn(options=classes, help="Class travelled"),
+                    "Priced as": st.column_config.SelectboxColumn(options=classes, help="Class whose factor it gets instead"),
+                    "Drop": st.column_config.TextColumn(
+                        help="Airports or routes left out, separated by semicolons, e.g. LHR; JFK > SIN"
+                    ),
+                },
+            )
+            with profiling.stage("dashboard.scenarios", rows=len(df)):
+                scenario_summary, scenario_classes = compare_scenarios(
+                    session_scenario_base(df), scenario_list(scenario_rows, factor_tables), factor_tables
+                )
+            st.dataframe(
+                scenario_summary,
+                hide_index=True,
+                column_config={
+                    "Emissions": st.column_config.NumberColumn("Emissions (kg CO₂e)", format="localized"),
+                    "Change": st.column_config.NumberColumn("Change (kg CO₂e)", format="%+.2f"),
+                    "Change %": st.column_config.NumberColumn(format="percent"),
+                },
+            )
+            if scenario_summary["Unpriced rows"].any():
+                st.caption("Unpriced rows travel in a class the scenario's factor table has no factor for.")
+            if scenario_summary["Uncalculated rows"].any():
+                st.caption(
+                    "Uncalculated rows got no distance in the calculation (an unmatched airport, or a class the "
+                    "Emission Factors sheet has no factor for), so no scenario can price them."
+                )
+            scenario_chart = alt.Chart(scenario_classes).mark_bar().encode(
+                x=alt.X("Scenario", type="nominal", sort=None),
+                y=alt.Y("Emissions", type="quantitative", title="Emissions (kg CO₂e)"),
+                color=alt.Color("Class", type="nominal"),
+                tooltip=["Scenario", "Class", alt.Tooltip("Emissions", format=",.2f")],
+            )
+            st.altair_chart(scenario_chart, use_container_width=True)
+
+        st.divider()
+
         """#### Custom Visualization"""
         # Extract columns
-        numeric_columns = df.select_dtypes(include=['number']).columns.tolist()
-        categorical_columns = df.select_dtypes(include=['object']).columns.tolist()
+        numeric_columns = cube.measures
+        categorical_columns = cube.dimensions
+        # Tags with too many values for the cube are still grouped from the rows when the run kept them
+        row_columns = sorted(cube.skipped) if df is not None else []
 
         col1, col2, col3 = st.columns([0.1,0.1,0.1])
         with col1:
-            x_axis = st.selectbox("Select X-axis", options=categorical_columns + numeric_columns)
+            # Grouping by a numeric column needs the rows, which streaming mode does not keep
+            x_axis = st.selectbox("Select X-axis", options=categorical_columns + row_columns + (numeric_columns if df is not None else []))
         with col2:
             y_axis = st.selectbox("Select Y-axis", options=numeric_columns)
         with col3:
-            aggregation = st.selectbox("Aggregation Method", options=["sum", "mean", "median", "min", "max"])
+            aggregation = st.selectbox("Aggregation Method", options=AGGREGATIONS)
 
-        chart_type = st.radio("Chart Type", ["Bar", "Line", "Scatter"], horizontal=True)
+        chart_type = st.radio("Chart Type", ["Bar", "Line", "Scatter"] if df is not None else ["Bar", "Line"], horizontal=True)
 
         # Apply aggregation
-        if x_axis in df.columns and y_axis in df.columns:
-            agg_df = df.groupby(x_axis, dropna=False)[y_axis].agg(aggregation).reset_index()
-        else:
-            st.warning("Selected columns are not valid.")
-            st.stop()
+        with profiling.stage("dashboard.custom_chart"):
+            if x_axis in categorical_columns and y_axis in numeric_columns:
+                agg_df = cube.aggregate(x_axis, y_axis, aggregation, dropna=False).reset_index()
+            elif df is not None:
+                # Rows are only needed here; compact frames rebuild coordinate columns on demand
+                rows = select_columns(df, [x_axis, y_axis], reference_data.coordinates)
+                agg_df = rows.groupby(x_axis, dropna=False)[y_axis].agg(aggregation).reset_index()
+            else:
+                st.warning("Selected columns are not valid.")
+                st.stop()
 
         # Build chart
         if chart_type == "Bar":
             chart = alt.Chart(agg_df).mark_bar().encode(
-                x=alt.X(x_axis, type='ordinal' if x_axis in categorical_columns else 'quantitative'),
+                x=alt.X(x_axis, type='quantitative' if x_axis in numeric_columns else 'ordinal'),
                 y=alt.Y(y_axis, type='quantitative'),
                 tooltip=[x_axis, y_axis]
             )
         elif chart_type == "Line":
             chart = alt.Chart(agg_df).mark_line().encode(
-                x=alt.X(x_axis, type='ordinal' if x_axis in categorical_columns else 'quantitative'),
+                x=alt.X(x_axis, type='quantitative' if x_axis in numeric_columns else 'ordinal'),
                 y=alt.Y(y_axis, type='quantitative'),
                 tooltip=[x_axis, y_axis]
             )
         else:  # Scatter (no aggregation makes more sense here)
-            chart = alt.Chart(df).mark_circle(size=60).encode(
+            chart = alt.Chart(select_columns(df, [x_axis, y_axis], reference_data.coordinates)).mark_circle(size=60).encode(
                 x=alt.X(x_axis, type='quantitative' if x_axis in numeric_columns else 'ordinal'),
                 y=alt.Y(y_axis, type='quantitative'),
                 tooltip=[x_axis, y_axis]
             ).interactive()
         st.altair_chart(chart, use_container_width=True)
 
-        
+        st.divider()
+        """#### Export"""
+        # Each table is encoded only when asked for, chunk by chunk into the buffer the download button serves
+        export_measures = [measure for measure in AGGREGATE_MEASURES if measure in cube.measures]
+        exports = {
+            "Emissions by class": ("emissions_by_class", lambda: cube.summary("Class", export_measures), None),
+            "Emissions by route": ("emissions_by_route", lambda: cube.summary("Route", export_measures), None),
+        }
+        if df is not None:
+            exports["Processed data"] = (
+                "processed_data", lambda: df, lambda chunk: expand_frame(chunk, reference_data.coordinates)
+            )
+        col1, col2, col3 = st.columns([0.1, 0.1, 0.1])
+        with col1:
+            export_name = st.selectbox("Table", options=list(exports))
+        with col2:
+            export_format = st.selectbox(
+                "Format", options=list(EXPORT_FORMATS), format_func={"parquet": "Parquet", "arrow": "Arrow IPC"}.get
+            )
+        with col3:
+            st.write("")
+            prepare = st.button("Prepare download", icon=":material/file_export:")
+        if prepare:
+            file_stem, frame, transform = exports[export_name]
+            extension, mime = EXPORT_FORMATS[export_format]
+            frame = frame()
+            with profiling.stage("dashboard.export", rows=len(frame)):
+                buffer = export_buffer(frame, export_format, transform)
+            st.download_button(
+                f"Download {file_stem}{extension} ({buffer.getbuffer().nbytes / 1e6:,.1f} MB)",
+                data=buffer,
+                file_name=f"{file_stem}{extension}",
+                mime=mime,
+                on_click="ignore",
+                type="primary",
+                icon=":material/download:",
+            )
 
     else:
         st.warning("No data available. Please upload files in the **Upload Data** tab first.")
 
+    record_profile(dashboard_profiler)
+
+diagnostics_panel()
+
     
@@ -1,29 +1,30 @@
 import streamlit as st
-from pathlib import Path
-import pandas as pd
+from emissions import profiling
+from emissions.store import shared_reference
+from ui.diagnostics import diagnostics_enabled, diagnostics_panel, record_profile
 from utils.tables import table
 
-avarni_file_path = Path(__file__).parent / "data" / "Avarni_Flight-Distance-Emissions-Calculator.xlsm"
-
-tab1, tab2 = st.tabs(["Airports", "Emission Factors"])
-
-with tab1:
-    airports = pd.read_excel(avarni_file_path, sheet_name="Airports")
-    table(
-        data=airports,
-        title="Airports",
-        subtitle="Details about Airport IATA code, Name, Country and Geographic coordinates. Use the '**Lookup**' column to fill the origin and destination columns in the template.")
-    
-with tab2:
-    emission_factors = pd.read_excel(avarni_file_path, sheet_name="Emission Factors", header=2)
-    table(
-        data=emission_factors,
-        title="Emission Factors",
-        subtitle="Source details of the emission factors used in the app")
-    
-
-
-
-
-
-
+# Only the selected sheet is loaded and rendered, unlike tabs which run every tab on each visit
+view = st.radio("Sheet", ["Airports", "Emission Factors"], horizontal=True, label_visibility="collapsed", key="background-view")
+
+with profiling.profile("background data", trace_memory=diagnostics_enabled()) as profiler:
+    # The same read-only tables the calculator uses, loaded once per process
+    reference_data = shared_reference()
+
+    if view == "Emission Factors":
+        emission_factors = reference_data.emission_factors
+        with profiling.stage("ui.render_emission_factors", rows=len(emission_factors)):
+            table(
+                data=emission_factors,
+                title="Emission Factors",
+                subtitle="Source details of the emission factors used in the app")
+    else:
+        airports = reference_data.airports
+        with profiling.stage("ui.render_airports", rows=len(airports)):
+            table(
+                data=airports,
+                title="Airports",
+                subtitle="Details about Airport IATA code, Name, Country and Geographic coordinates. Use the '**Lookup**' column to fill the origin and destination columns in the template.")
+    record_profile(profiler)
+
+diagnostics_panel()
@@ -0,0 +1,34 @@
+"""Business travel emissions calculation, usable without Streamlit.
+
+The calculator pages and the ``python -m emissions`` command line both build on these modules.
+"""
+from emissions.distances import DistanceModel, distance_model, haversine_km, vincenty_km
+from emissions.engine import calculate_emissions
+from emissions.parallel import calculate_files, merge_results, stream_files
+from emissions.reference import load_airports, load_emission_factors
+from emissions.resolver import AirportResolver, resolve_unresolved
+from emissions.routes import RouteIndex, open_route_index
+from emissions.scenarios import Scenario, ScenarioBase, compare_scenarios
+from emissions.streaming import EmissionTotals, stream_emissions
+
+__all__ = [
+    "AirportResolver",
+    "DistanceModel",
+    "EmissionTotals",
+    "RouteIndex",
+    "Scenario",
+    "ScenarioBase",
+    "calculate_emissions",
+    "calculate_files",
+    "compare_scenarios",
+    "distance_model",
+    "haversine_km",
+    "load_airports",
+    "load_emission_factors",
+    "merge_results",
+    "open_route_index",
+    "resolve_unresolved",
+    "stream_emissions",
+    "stream_files",
+    "vincenty_km",
+]
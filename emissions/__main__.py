@@ -0,0 +1,3 @@
+from emissions.cli import main
+
+raise SystemExit(main())
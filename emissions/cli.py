@@ -0,0 +1,149 @@
+"""Batch emissions runs without Streamlit.
+
+    python -m emissions "exports/2025-*.csv" --output results.parquet --summary summary.json
+"""
+import argparse
+import glob
+import json
+import sys
+import time
+from pathlib import Path
+
+from emissions import profiling, reference
+from emissions.distances import DEFAULT_MODEL, MODELS
+from emissions.export import ChunkWriter, output_format, write_frame
+from emissions.ingest import DEFAULT_CHUNKSIZE
+from emissions.parallel import calculate_files, default_workers, merge_results
+from emissions.resolver import DEFAULT_MIN_CONFIDENCE, AirportResolver, read_aliases, resolve_unresolved
+from emissions.routes import open_route_index
+from emissions.streaming import EmissionTotals, stream_emissions
+
+TOP_ROUTES = 10
+
+
+def expand_inputs(patterns):
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        paths.extend(Path(match) for match in matches)
+    missing = [str(path) for path in paths if not path.is_file()]
+    if missing:
+        raise FileNotFoundError(f"Input not found: {', '.join(missing)}")
+    if not paths:
+        raise FileNotFoundError(f"No input files match {' '.join(patterns)}")
+    return paths
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m emissions", description="Calculate business travel emissions in batch.")
+    parser.add_argument("inputs", nargs="+", help="CSV or Parquet files, or glob patterns such as 'exports/**/*.csv'")
+    parser.add_argument("--workbook", default=reference.WORKBOOK_PATH, type=Path, help="Avarni workbook with the Airports and Emission Factors sheets")
+    parser.add_argument("--cache-dir", default=reference.CACHE_DIR, type=Path, help="Reference-data cache directory")
+    parser.add_argument("-o", "--output", type=Path, help="Processed rows as .parquet, .arrow, .csv or .csv.gz")
+    parser.add_argument("--summary", type=Path, help="Write the run summary as JSON here instead of stdout")
+    parser.add_argument("-j", "--workers", type=int, default=1, help=f"Worker processes (this machine has {default_workers()})")
+    parser.add_argument("--stream", action="store_true", help="Read inputs in chunks so memory follows --chunksize instead of file size")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Rows per chunk in --stream mode")
+    parser.add_argument("--resolve", action="store_true", help="Match unknown airport values by name, normalized spelling and near-misses")
+    parser.add_argument("--aliases", type=Path, help="Headerless CSV of spellings and the Airports Lookup each one means (implies --resolve)")
+    parser.add_argument("--min-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE, help="Lowest match confidence that is applied")
+    parser.add_argument("--distance-model", choices=list(MODELS), default=DEFAULT_MODEL,
+                        help="Spherical great-circle or WGS-84 ellipsoidal distances, optionally with DEFRA's 8%% uplift")
+    parser.add_argument("--profile", type=Path, help="Write per-stage timings, rows/s, bytes read and peak memory as JSON here (slower: traces memory)")
+    return parser
+
+
+def run(args):
+    started = time.perf_counter()
+    paths = expand_inputs(args.inputs)
+    cache_dir = args.cache_dir
+    routes = open_route_index(workbook_path=args.workbook, cache_dir=cache_dir, model=args.distance_model)
+    totals = EmissionTotals()
+    errors = {}
+    airports = reference.load_airports(args.workbook, cache_dir)
+    emission_factors = reference.load_emission_factors(args.workbook, cache_dir)
+    resolver = None
+    if args.resolve or args.aliases:
+        resolver = AirportResolver(airports).with_aliases(read_aliases(args.aliases) if args.aliases else None)
+        for alias, lookup in resolver.invalid_aliases.items():
+            print(f"warning: alias {alias!r} points at unknown Lookup {lookup!r}", file=sys.stderr)
+
+    if args.stream:
+        writer = ChunkWriter(args.output) if args.output else None
+        try:
+            for path in paths:
+                with open(path, "rb") as file:
+                    file_totals, _ = stream_emissions(
+                        [file], airports, emission_factors, routes=routes, chunksize=args.chunksize,
+                        on_chunk=(lambda name, file_format, processed: writer.write(processed)) if writer else None,
+                        resolver=resolver, min_confidence=args.min_confidence,
+                    )
+                totals.merge(file_totals)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        results = calculate_files(
+            paths, workers=args.workers, routes=routes, workbook_path=args.workbook, cache_dir=cache_dir,
+            airports=airports, emission_factors=emission_factors,
+        )
+        for i, result in enumerate(results):
+            if result.error is not None:
+                errors[result.name] = result.error
+                continue
+            if resolver is not None:
+                processed, unresolved, report = resolve_unresolved(
+                    result.processed, result.unresolved, resolver, airports, emission_factors,
+                    routes=routes, min_confidence=args.min_confidence,
+                )
+                totals.add_resolution(report)
+                results[i] = result = result._replace(processed=processed, unresolved=unresolved)
+            totals.update(result.processed, result.unresolved, filename=result.name)
+        business_data, _ = merge_results(results)
+        if args.output and business_data is not None:
+            write_frame(business_data, args.output)
+    routes.save()
+
+    elapsed = time.perf_counter() - started
+    summary = totals.summary()
+    summary.update({
+        "emissions_by_class": totals.by_class.to_dict(),
+        "top_routes": totals.by_route.sort_values(ascending=False).head(TOP_ROUTES).to_dict(),
+        "unresolved_values": totals.unresolved_values,
+        "resolved_values": totals.resolution.to_dict(orient="records"),
+        "errors": errors,
+        "distance_model": routes.model.name,
+        "route_cache": routes.stats(),
+        "output": str(args.output) if args.output else None,
+        "elapsed_s": elapsed,
+        "rows_per_s": totals.rows / elapsed if elapsed else None,
+    })
+    return summary
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.output:
+        try:
+            output_format(args.output)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.stream and args.workers > 1:
+        parser.error("--stream writes rows in order from a single process; drop --workers or --stream")
+
+    try:
+        with profiling.profile("cli", trace_memory=args.profile is not None) as profiler:
+            summary = run(args)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    if args.profile:
+        args.profile.write_text(profiler.to_json())
+
+    text = json.dumps(summary, indent=2, default=float)
+    if args.summary:
+        args.summary.write_text(text)
+    else:
+        print(text)
+    return 1 if summary["errors"] else 0
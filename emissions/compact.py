@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+COORDINATE_COLUMNS = ["Origin_Lat", "Origin_Lon", "Destination_Lat", "Destination_Lon"]
+ID_COLUMNS = {"Origin": "Origin_id", "Destination": "Destination_id"}
+
+# String columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_RATIO = 0.5
+
+
+def memory_usage(frame):
+    return int(frame.memory_usage(deep=True, index=True).sum())
+
+
+def airport_ids(frame, coordinates):
+    """int32 positions of each leg's origin and destination in `coordinates`, -1 where unknown.
+
+    Compact frames already carry them; processed frames get them from the Lookup index.
+    """
+    if set(ID_COLUMNS.values()) <= set(frame.columns):
+        return {id_column: frame[id_column].to_numpy() for id_column in ID_COLUMNS.values()}
+    resolved = frame["Origin_Lat"].notna().to_numpy()
+    return {
+        id_column: np.where(resolved, coordinates.index.get_indexer(frame[column]), -1).astype("int32")
+        for column, id_column in ID_COLUMNS.items()
+    }
+
+
+def compact_frame(business_data, coordinates):
+    """Shrink a processed frame for long-lived storage.
+
+    Repeated strings become categoricals (dictionary-encoded when written to Arrow/Parquet), and
+    the four coordinate columns are replaced by int32 positions into `coordinates`, the
+    deduplicated airport table from `engine.airport_lookup`; -1 marks legs without coordinates.
+    """
+    frame = business_data
+    if set(COORDINATE_COLUMNS) <= set(frame.columns):
+        frame = frame.drop(columns=COORDINATE_COLUMNS).assign(**airport_ids(frame, coordinates))
+
+    limit = max(1, int(len(frame) * CATEGORY_MAX_RATIO))
+    categories = {
+        column: frame[column].astype("category")
+        for column in frame.select_dtypes(include=["object", "string"]).columns
+        if frame[column].nunique(dropna=True) <= limit
+    }
+    return frame.assign(**categories)
+
+
+def _coordinate(frame, column, coordinates):
+    end, axis = column.rsplit("_", 1)
+    ids = frame[ID_COLUMNS[end]].to_numpy()
+    values = coordinates[axis].to_numpy(dtype="float64")
+    # Id -1 picks the NaN appended at the end
+    return np.append(values, np.nan)[ids]
+
+
+def select_columns(frame, columns, coordinates):
+    """`frame[columns]`, rebuilding coordinate columns from airport ids when the frame is compact."""
+    selected = {}
+    for column in dict.fromkeys(columns):
+        if column in frame.columns:
+            selected[column] = frame[column]
+        elif column in COORDINATE_COLUMNS and set(ID_COLUMNS.values()) <= set(frame.columns):
+            selected[column] = pd.Series(_coordinate(frame, column, coordinates), index=frame.index)
+        else:
+            raise KeyError(column)
+    return pd.DataFrame(selected, index=frame.index)
+
+
+def expand_frame(frame, coordinates):
+    # Full processed layout again, e.g. for export
+    if not set(ID_COLUMNS.values()) <= set(frame.columns):
+        return frame
+    restored = {column: _coordinate(frame, column, coordinates) for column in COORDINATE_COLUMNS}
+    return frame.drop(columns=list(ID_COLUMNS.values())).assign(**restored)
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+from emissions import profiling
+from emissions.compact import compact_frame, memory_usage
+from emissions.distances import distance_model
+from emissions.parallel import merge_results
+from emissions.resolver import DEFAULT_MIN_CONFIDENCE, resolve_unresolved
+from emissions.results import calculate_cached
+from emissions.rollup import RollupCube, route_labels
+
+DEFAULT_MAX_BYTES = int(os.environ.get("BUSINESS_TRAVEL_DATASET_CACHE_MB", 1024)) * 1024 * 1024
+
+# Everything the dashboard needs from one calculation; `full_bytes` is the size before compaction
+Dataset = namedtuple("Dataset", ["business_data", "unresolved", "resolution", "rollup", "errors", "full_bytes"])
+
+
+def dataset_key(file_keys, names, compact=True, resolver=None, min_confidence=DEFAULT_MIN_CONFIDENCE, model=None):
+    """Identity of a calculation: the files' content keys and names plus every option that changes the result."""
+    options = {
+        "files": list(zip(file_keys, names)),
+        "compact": bool(compact),
+        "distance_model": distance_model(model).name,
+        "resolve": None if resolver is None else {
+            "aliases": sorted(resolver.aliases.items()),
+            "min_confidence": float(min_confidence),
+        },
+    }
+    return hashlib.sha256(json.dumps(options).encode()).hexdigest()
+
+
+def dataset_bytes(dataset):
+    frames = [dataset.business_data, dataset.unresolved, dataset.resolution]
+    if dataset.rollup is not None:
+        frames += list(dataset.rollup.tables.values()) + list(dataset.rollup.sketches.values())
+    return sum(memory_usage(frame) for frame in frames if frame is not None)
+
+
+def build_dataset(files, result_cache, airports, emission_factors, coordinates, keys=None, workers=None,
+                  routes=None, resolver=None, min_confidence=DEFAULT_MIN_CONFIDENCE, compact=True, model=None):
+    """Calculate `files` (reusing per-file results from `result_cache`) into one shareable `Dataset`.
+
+    Returns the dataset and the number of files whose results were reused.
+    """
+    results, reused = calculate_cached(
+        files, result_cache, workers=workers, routes=routes, keys=keys, model=model,
+        airports=airports, emission_factors=emission_factors,
+    )
+    errors = {result.name: result.error for result in results if result.error is not None}
+    business_data, unresolved = merge_results(results)
+    if business_data is None:
+        return Dataset(None, None, None, None, errors, 0), reused
+
+    resolution = None
+    if resolver is not None:
+        business_data, unresolved, resolution = resolve_unresolved(
+            business_data, unresolved, resolver, airports, emission_factors, routes=routes,
+            min_confidence=min_confidence, model=model,
+        )
+    with profiling.stage("route_labels", rows=len(business_data)):
+        business_data["Route"] = route_labels(business_data)
+    rollup = RollupCube.from_frame(business_data)
+    full_bytes = memory_usage(business_data)
+    if compact:
+        with profiling.stage("compact", rows=len(business_data)):
+            business_data = compact_frame(business_data, coordinates)
+    return Dataset(business_data, unresolved, resolution, rollup, errors, full_bytes), reused
@@ -0,0 +1,225 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371  # Radius of Earth in kilometers
+
+# WGS-84 ellipsoid
+WGS84_A_KM = 6378.137
+WGS84_F = 1 / 298.257223563
+WGS84_B_KM = WGS84_A_KM * (1 - WGS84_F)
+
+# DEFRA adds 8% to the great-circle distance for indirect routing, stacking and delays
+DEFRA_UPLIFT = 0.08
+
+VINCENTY_TOLERANCE = 1e-12
+VINCENTY_MAX_ITERATIONS = 200
+BISECTION_STEPS = 64
+DEGENERATE_SIGMA = 1e-12
+
+DEFAULT_MODEL = "haversine"
+
+
+def haversine_km(origin_lat, origin_lon, dest_lat, dest_lon):
+    # Great-circle distance for whole arrays of coordinates at once
+    origin_lat, origin_lon, dest_lat, dest_lon = (
+        np.radians(np.asarray(v, dtype="float64")) for v in (origin_lat, origin_lon, dest_lat, dest_lon)
+    )
+    d_lat = dest_lat - origin_lat
+    d_lon = dest_lon - origin_lon
+    a = np.sin(d_lat / 2)**2 + np.cos(origin_lat) * np.cos(dest_lat) * np.sin(d_lon / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def _vincenty_step(lam, L, sin_u1, cos_u1, sin_u2, cos_u2):
+    # One evaluation of Vincenty's inverse equations at auxiliary-sphere longitude `lam`
+    sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+    sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+    cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+    sigma = np.arctan2(sin_sigma, cos_sigma)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Coincident points have no azimuth, and equatorial lines have no cos(2σm)
+        sin_alpha = np.where(sin_sigma > DEGENERATE_SIGMA, cos_u1 * cos_u2 * sin_lam / sin_sigma, 0.0)
+        cos2_alpha = 1 - sin_alpha**2
+        cos_2sm = np.where(cos2_alpha > 0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha, 0.0)
+    next_lam = L + _longitude_excess(sin_alpha, cos2_alpha, sigma, sin_sigma, cos_sigma, cos_2sm)
+    return next_lam, sin_sigma, cos_sigma, sigma, cos2_alpha, cos_2sm
+
+
+def _longitude_excess(sin_alpha, cos2_alpha, sigma, sin_sigma, cos_sigma, cos_2sm):
+    # How much further a geodesic spanning `sigma` goes in auxiliary-sphere longitude than on the ellipsoid
+    c = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+    return (1 - c) * WGS84_F * sin_alpha * (
+        sigma + c * sin_sigma * (cos_2sm + c * cos_sigma * (-1 + 2 * cos_2sm**2))
+    )
+
+
+def _length(sigma, sin_sigma, cos_sigma, cos2_alpha, cos_2sm):
+    # Vincenty's distance series for an arc of `sigma` on the auxiliary sphere
+    u_sq = cos2_alpha * (WGS84_A_KM**2 - WGS84_B_KM**2) / WGS84_B_KM**2
+    a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = b * sin_sigma * (cos_2sm + b / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sm**2) - b / 6 * cos_2sm * (-3 + 4 * sin_sigma**2) * (-3 + 4 * cos_2sm**2)
+    ))
+    return WGS84_B_KM * a * (sigma - delta_sigma)
+
+
+def _azimuth_geodesic(alpha1, sin_b1, cos_b1, sin_b2, cos_b2):
+    # The geodesic leaving point 1 at azimuth alpha1, followed until it first reaches point 2's
+    # latitude heading north (Karney 2013, section 4). Needs b1 <= 0 and |b2| <= |b1|.
+    sin_a1, cos_a1 = np.sin(alpha1), np.cos(alpha1)
+    sin_a0 = sin_a1 * cos_b1
+    cos2_a0 = cos_a1**2 + (sin_a1 * sin_b1) ** 2
+    # cos(alpha2) * cos(b2), in the form that stays accurate when |b2| is close to |b1|
+    cos_a2_b2 = np.sqrt(np.maximum((cos_a1 * cos_b1) ** 2 + np.where(
+        cos_b1 < -sin_b1, (cos_b2 - cos_b1) * (cos_b1 + cos_b2), (sin_b1 - sin_b2) * (sin_b1 + sin_b2)
+    ), 0.0))
+    cos_a2_b2 = np.where((cos_b2 == cos_b1) & (np.abs(sin_b2) == -sin_b1), np.abs(cos_a1) * cos_b2, cos_a2_b2)
+    sigma1 = np.arctan2(sin_b1, cos_a1 * cos_b1)
+    sigma2 = np.arctan2(sin_b2, cos_a2_b2)
+    sigma = np.arctan2(
+        np.maximum(np.cos(sigma1) * np.sin(sigma2) - np.sin(sigma1) * np.cos(sigma2), 0.0),
+        np.cos(sigma1) * np.cos(sigma2) + np.sin(sigma1) * np.sin(sigma2),
+    )
+    omega1 = np.arctan2(sin_a0 * sin_b1, cos_a1 * cos_b1)
+    omega2 = np.arctan2(sin_a0 * sin_b2, cos_a2_b2)
+    omega = np.arctan2(
+        np.maximum(np.cos(omega1) * np.sin(omega2) - np.sin(omega1) * np.cos(omega2), 0.0),
+        np.cos(omega1) * np.cos(omega2) + np.sin(omega1) * np.sin(omega2),
+    )
+    cos_2sm = np.cos(sigma1 + sigma2)
+    return sin_a0, cos2_a0, sigma, np.sin(sigma), np.cos(sigma), cos_2sm, omega
+
+
+def _solve_by_azimuth(L, u1, u2):
+    """Geodesic distance found by bisection on the starting azimuth, for pairs where Vincenty's
+    iteration on the longitude fails (near-antipodal points).
+
+    The pair is first put in Karney's canonical order (|b1| >= |b2|, b1 <= 0), where the
+    longitude reached grows monotonically from 0 at due north to π at due south, so bisection
+    always finds the shortest geodesic, whether it runs near the equator, over a pole or between.
+    """
+    swap = np.abs(u1) < np.abs(u2)
+    u1, u2 = np.where(swap, u2, u1), np.where(swap, u1, u2)
+    flip = u1 > 0
+    u1, u2 = np.where(flip, -u1, u1), np.where(flip, -u2, u2)
+    sin_b1, cos_b1, sin_b2, cos_b2 = np.sin(u1), np.cos(u1), np.sin(u2), np.cos(u2)
+
+    # Due north (α1 = 0) reaches longitude 0 and due south (α1 = π) longitude π
+    lo, hi = np.zeros(len(L)), np.full(len(L), np.pi)
+    for _ in range(BISECTION_STEPS):
+        mid = (lo + hi) / 2
+        sin_a0, cos2_a0, sigma, sin_sigma, cos_sigma, cos_2sm, omega = _azimuth_geodesic(
+            mid, sin_b1, cos_b1, sin_b2, cos_b2
+        )
+        reached = omega - _longitude_excess(sin_a0, cos2_a0, sigma, sin_sigma, cos_sigma, cos_2sm)
+        short = reached < L
+        lo = np.where(short, mid, lo)
+        hi = np.where(short, hi, mid)
+    _, cos2_a0, sigma, sin_sigma, cos_sigma, cos_2sm, _ = _azimuth_geodesic(
+        (lo + hi) / 2, sin_b1, cos_b1, sin_b2, cos_b2
+    )
+    return _length(sigma, sin_sigma, cos_sigma, cos2_a0, cos_2sm)
+
+
+def vincenty_km(origin_lat, origin_lon, dest_lat, dest_lon):
+    """Geodesic distance on the WGS-84 ellipsoid for whole arrays of coordinates (Vincenty's inverse).
+
+    Pairs are iterated together until each converges. Near-antipodal pairs, where the fixed-point
+    iteration oscillates or settles on the equatorial branch past λ = π, are solved instead by
+    bisection on the starting azimuth (see `_solve_by_azimuth`).
+    """
+    origin_lat, origin_lon, dest_lat, dest_lon = np.broadcast_arrays(*(
+        np.radians(np.asarray(v, dtype="float64")) for v in (origin_lat, origin_lon, dest_lat, dest_lon)
+    ))
+    shape = origin_lat.shape
+    origin_lat, origin_lon, dest_lat, dest_lon = (v.ravel() for v in (origin_lat, origin_lon, dest_lat, dest_lon))
+    # The distance only depends on the size of the longitude difference
+    L = np.abs((dest_lon - origin_lon + np.pi) % (2 * np.pi) - np.pi)
+    u1 = np.arctan((1 - WGS84_F) * np.tan(origin_lat))
+    u2 = np.arctan((1 - WGS84_F) * np.tan(dest_lat))
+    sin_u1, cos_u1, sin_u2, cos_u2 = np.sin(u1), np.cos(u1), np.sin(u2), np.cos(u2)
+
+    lam = L.copy()
+    active = np.flatnonzero(~np.isnan(L + u1 + u2))
+    for _ in range(VINCENTY_MAX_ITERATIONS):
+        if not len(active):
+            break
+        next_lam = _vincenty_step(
+            lam[active], L[active], sin_u1[active], cos_u1[active], sin_u2[active], cos_u2[active]
+        )[0]
+        converged = np.abs(next_lam - lam[active]) <= VINCENTY_TOLERANCE
+        lam[active] = next_lam
+        active = active[~converged]
+    # A fixed point past π lies on the equatorial branch, not on the shortest geodesic
+    active = np.union1d(active, np.flatnonzero(lam > np.pi))
+
+    _, sin_sigma, cos_sigma, sigma, cos2_alpha, cos_2sm = _vincenty_step(lam, L, sin_u1, cos_u1, sin_u2, cos_u2)
+    distance = _length(sigma, sin_sigma, cos_sigma, cos2_alpha, cos_2sm)
+    if len(active):
+        distance[active] = _solve_by_azimuth(L[active], u1[active], u2[active])
+    return distance.reshape(shape)
+
+
+KERNELS = {
+    "haversine": haversine_km,
+    "vincenty": vincenty_km,
+}
+
+# Raised when a kernel's results change, so distances stored by an older version are not reused
+KERNEL_REVISIONS = {
+    "haversine": 1,
+    "vincenty": 2,  # near-antipodal pairs solved by azimuth bisection
+}
+
+# Selectable models, "<kernel>" or "<kernel>+defra"
+MODELS = {
+    "haversine": "Great circle (spherical, R = 6,371 km)",
+    "haversine+defra": "Great circle + DEFRA 8% uplift",
+    "vincenty": "Ellipsoidal (WGS-84, Vincenty)",
+    "vincenty+defra": "Ellipsoidal (WGS-84) + DEFRA 8% uplift",
+}
+
+
+class DistanceModel:
+    """One-way flight distance between arrays of coordinates: a spherical or ellipsoidal kernel,
+    optionally scaled by DEFRA's distance uplift."""
+
+    def __init__(self, kernel=DEFAULT_MODEL, uplift=False):
+        if kernel not in KERNELS:
+            raise ValueError(f"Unknown distance kernel {kernel!r}: use one of {', '.join(KERNELS)}")
+        self.kernel = kernel
+        self.uplift = uplift
+
+    @property
+    def name(self):
+        return f"{self.kernel}+defra" if self.uplift else self.kernel
+
+    @property
+    def cache_name(self):
+        # `name`, plus the kernel revision once it has moved past the first
+        revision = KERNEL_REVISIONS[self.kernel]
+        return self.name if revision == 1 else f"{self.name}.r{revision}"
+
+    def __repr__(self):
+        return f"DistanceModel({self.name!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, DistanceModel) and other.name == self.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def distance_km(self, origin_lat, origin_lon, dest_lat, dest_lon):
+        distance = KERNELS[self.kernel](origin_lat, origin_lon, dest_lat, dest_lon)
+        return distance * (1 + DEFRA_UPLIFT) if self.uplift else distance
+
+
+def distance_model(model=None):
+    """A `DistanceModel` from its name (see MODELS), an existing model, or None for the default."""
+    if isinstance(model, DistanceModel):
+        return model
+    kernel, _, uplift = (model or DEFAULT_MODEL).partition("+")
+    if uplift not in ("", "defra"):
+        raise ValueError(f"Unknown distance model {model!r}: use one of {', '.join(MODELS)}")
+    return DistanceModel(kernel, uplift=bool(uplift))
@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+
+from emissions import profiling
+from emissions.distances import EARTH_RADIUS_KM, distance_model, haversine_km  # noqa: F401 (kept importable from here)
+
+OUTPUT_COLUMNS = [
+    "Emission_Factor",
+    "Distance_km",
+    "Passenger_distance_pkm",
+    "Emissions",
+    "Origin_Lat",
+    "Origin_Lon",
+    "Destination_Lat",
+    "Destination_Lon",
+]
+
+
+def airport_lookup(airports):
+    # The Airports sheet repeats some city Lookups (e.g. "Chicago"); like `.loc[[...]].values[0]`
+    # the first listed airport wins.
+    return airports.drop_duplicates("Lookup").set_index("Lookup")[["Lat", "Lon"]]
+
+
+def factor_lookup(emission_factors):
+    return emission_factors.drop_duplicates("Class").set_index("Class")["Factor CO2e Value"]
+
+
+def passenger_counts(business_data):
+    # Missing or zero passenger counts fall back to a single passenger
+    if "Num_Passengers" in business_data:
+        passengers = business_data["Num_Passengers"]
+    elif "Num Passengers" in business_data:
+        passengers = business_data["Num Passengers"]
+    else:
+        return pd.Series(1.0, index=business_data.index)
+    passengers = pd.to_numeric(passengers, errors="coerce")
+    return passengers.mask(passengers == 0, 1)
+
+
+def return_flags(business_data):
+    if "Return_trip" not in business_data:
+        return pd.Series(False, index=business_data.index)
+    # Parse each distinct value once; exports only ever use a handful of spellings
+    codes, values = pd.factorize(business_data["Return_trip"], use_na_sentinel=False)
+    is_return = pd.Index(values).astype(str).str.strip().str.lower() == "return"
+    return pd.Series(is_return[codes], index=business_data.index)
+
+
+def route_distances(coordinates, origin_pos, dest_pos, routes=None, model=None):
+    # One-way distance per row, computed once per distinct route and broadcast back
+    n = len(coordinates)
+    pairs, inverse = np.unique(origin_pos.astype("int64") * n + dest_pos, return_inverse=True)
+    profiling.count("engine.distinct_routes", len(pairs))
+    origin_pos, dest_pos = pairs // n, pairs % n
+    lat = coordinates["Lat"].to_numpy(dtype="float64")
+    lon = coordinates["Lon"].to_numpy(dtype="float64")
+    if routes is None:
+        distances = distance_model(model).distance_km(lat[origin_pos], lon[origin_pos], lat[dest_pos], lon[dest_pos])
+    else:
+        distances = routes.lookup(
+            coordinates.index[origin_pos].tolist(), coordinates.index[dest_pos].tolist(),
+            lat[origin_pos], lon[origin_pos], lat[dest_pos], lon[dest_pos],
+        )
+    return distances[inverse.reshape(-1)]
+
+
+def calculate_emissions(business_data, airports, emission_factors, routes=None, model=None):
+    """Compute distances and emissions for every row of `business_data` in one pass.
+
+    Returns the processed frame and a boolean frame (Origin, Destination, Class) marking
+    the values that could not be resolved against the reference tables. Passing a
+    `RouteIndex` as `routes` reuses distances already known for a city pair. Distances
+    follow `model` (a `distances.MODELS` name or `DistanceModel`, haversine by default),
+    or the route index's own model when one is passed.
+    """
+    if routes is not None and model is not None and distance_model(model) != routes.model:
+        raise ValueError(f"Distance model {distance_model(model).name} does not match the route index ({routes.model.name})")
+    rows = len(business_data)
+    with profiling.stage("engine.lookup", rows=rows):
+        business_data = business_data.copy()
+        coordinates = airport_lookup(airports)
+        factors = factor_lookup(emission_factors)
+
+        origin_pos = coordinates.index.get_indexer(business_data["Origin"])
+        dest_pos = coordinates.index.get_indexer(business_data["Destination"])
+        emission_factor = business_data["Class"].map(factors).to_numpy(dtype="float64")
+
+        unresolved = pd.DataFrame({
+            "Origin": origin_pos < 0,
+            "Destination": dest_pos < 0,
+            "Class": np.isnan(emission_factor),
+        }, index=business_data.index)
+
+        # Coordinates are only reported when both ends of the leg are known
+        found = (origin_pos >= 0) & (dest_pos >= 0)
+        lat = coordinates["Lat"].to_numpy(dtype="float64")
+        lon = coordinates["Lon"].to_numpy(dtype="float64")
+        origin_lat = np.where(found, lat[origin_pos], np.nan)
+        origin_lon = np.where(found, lon[origin_pos], np.nan)
+        dest_lat = np.where(found, lat[dest_pos], np.nan)
+        dest_lon = np.where(found, lon[dest_pos], np.nan)
+
+        valid = found & ~np.isnan(emission_factor)
+        valid &= ~np.isnan(origin_lat) & ~np.isnan(origin_lon) & ~np.isnan(dest_lat) & ~np.isnan(dest_lon)
+    profiling.count("engine.unresolved_rows", int(rows - valid.sum()))
+
+    with profiling.stage("engine.distance", rows=int(valid.sum())):
+        distance = np.full(rows, np.nan)
+        if valid.any():
+            distance[valid] = route_distances(coordinates, origin_pos[valid], dest_pos[valid], routes, model)
+
+    with profiling.stage("engine.emissions", rows=rows):
+        distance = np.where(return_flags(business_data).to_numpy(), distance * 2, distance)
+        emission_factor = np.where(valid, emission_factor, np.nan)
+        emissions = distance * passenger_counts(business_data).to_numpy(dtype="float64") * emission_factor
+
+        # pkm keeps the passenger count as entered (a zero stays zero)
+        if "Num_Passengers" in business_data:
+            entered = pd.to_numeric(business_data["Num_Passengers"], errors="coerce").to_numpy(dtype="float64")
+        else:
+            entered = passenger_counts(business_data).to_numpy(dtype="float64")
+
+        business_data["Emission_Factor"] = emission_factor
+        business_data["Distance_km"] = distance
+        business_data["Passenger_distance_pkm"] = distance * entered
+        business_data["Emissions"] = emissions
+        business_data["Origin_Lat"] = origin_lat
+        business_data["Origin_Lon"] = origin_lon
+        business_data["Destination_Lat"] = dest_lat
+        business_data["Destination_Lon"] = dest_lon
+    return business_data, unresolved
+
+
+def unresolved_summary(business_data, unresolved):
+    # Distinct unresolved values with how many rows they affect, for a single error message
+    summary = {}
+    for column in unresolved.columns:
+        values = business_data.loc[unresolved[column], column]
+        if len(values):
+            summary[column] = values.astype(str).value_counts().to_dict()
+    return summary
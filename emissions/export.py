@@ -0,0 +1,109 @@
+import io
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+PARQUET_COMPRESSION = "zstd"
+ARROW_COMPRESSION = "zstd"
+
+# File extension and media type of each downloadable format
+FORMATS = {
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrow", "application/vnd.apache.arrow.file"),
+}
+EXPORT_CHUNKSIZE = 100_000
+# Measures worth summarising in the exported per-class and per-route tables
+AGGREGATE_MEASURES = ["Num_Passengers", "Distance_km", "Passenger_distance_pkm", "Emissions"]
+
+
+def output_format(path):
+    suffixes = Path(path).suffixes
+    if suffixes and suffixes[-1] == ".parquet":
+        return "parquet"
+    if suffixes and suffixes[-1] in (".arrow", ".feather"):
+        return "arrow"
+    if suffixes and ".csv" in suffixes:
+        return "csv"
+    raise ValueError(f"Unsupported output file {path}: use .parquet, .arrow or .csv (optionally .csv.gz)")
+
+
+def _arrow_schema(frame):
+    # Columns that are empty in the first chunk get a string type so later values still fit
+    schema = pa.Schema.from_pandas(frame, preserve_index=False)
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, field.with_type(pa.string()))
+    return schema
+
+
+class ChunkWriter:
+    """Append processed chunks to one CSV, Parquet or Arrow IPC file; later chunks follow the first chunk's columns.
+
+    `path` may also be a binary file object, in which case `file_format` must be given.
+    """
+
+    def __init__(self, path, file_format=None):
+        self.path = path if hasattr(path, "write") else Path(path)
+        self.format = file_format or output_format(path)
+        self.rows = 0
+        self._columns = None
+        self._schema = None
+        self._parquet = None
+        self._arrow = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, frame):
+        if self._columns is None:
+            self._columns = list(frame.columns)
+            if isinstance(self.path, Path):
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+        frame = frame.reindex(columns=self._columns)
+        if self._schema is None and self.format != "csv":
+            self._schema = _arrow_schema(frame)
+        if self.format == "parquet":
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, self._schema, compression=PARQUET_COMPRESSION)
+            self._parquet.write_table(pa.Table.from_pandas(frame, schema=self._schema, preserve_index=False))
+        elif self.format == "arrow":
+            if self._arrow is None:
+                options = pa.ipc.IpcWriteOptions(compression=ARROW_COMPRESSION)
+                self._arrow = pa.ipc.new_file(self.path, self._schema, options=options)
+            self._arrow.write_table(pa.Table.from_pandas(frame, schema=self._schema, preserve_index=False))
+        else:
+            frame.to_csv(self.path, mode="a" if self.rows else "w", header=not self.rows, index=False)
+        self.rows += len(frame)
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+        if self._arrow is not None:
+            self._arrow.close()
+            self._arrow = None
+
+
+def write_frame(frame, path):
+    with ChunkWriter(path) as writer:
+        writer.write(frame)
+
+
+def export_buffer(frame, file_format, transform=None, chunksize=EXPORT_CHUNKSIZE):
+    """`frame` encoded as Parquet or Arrow IPC in an in-memory file, ready for a download button.
+
+    Rows are converted and compressed `chunksize` at a time straight into the buffer, so neither
+    a full Arrow copy of the frame nor a second copy of the file is built. `transform`, if given,
+    is applied to each chunk, e.g. to expand a compact frame.
+    """
+    buffer = io.BytesIO()
+    with ChunkWriter(buffer, file_format) as writer:
+        for start in range(0, max(len(frame), 1), chunksize):
+            chunk = frame.iloc[start:start + chunksize]
+            writer.write(chunk if transform is None else transform(chunk))
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,120 @@
+import codecs
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from emissions import profiling
+
+PARQUET_MAGIC = b"PAR1"
+PREFIX_BYTES = 64 * 1024
+DEFAULT_CHUNKSIZE = 100_000
+
+
+def _latin1_fallback(error):
+    # Bytes that are not valid UTF-8 further into a file are read as latin1 instead of failing
+    profiling.count("ingest.latin1_fallback_bytes", error.end - error.start)
+    return error.object[error.start:error.end].decode("latin1"), error.end
+
+
+codecs.register_error("latin1_fallback", _latin1_fallback)
+
+
+def detect_encoding(prefix):
+    # A multi-byte character cut off at the end of the prefix is not a decoding error
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(prefix, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin1"  # fallback for Excel-exported files
+
+
+def sniff_encoding(file):
+    file.seek(0)
+    prefix = file.read(PREFIX_BYTES)
+    file.seek(0)
+    encoding = detect_encoding(prefix)
+    profiling.count(f"ingest.{encoding}_files")
+    return encoding
+
+
+def _position(file):
+    # Bytes consumed so far; the parsers read ahead in blocks, so per-chunk figures are approximate
+    try:
+        return file.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _size(file):
+    try:
+        return os.fstat(file.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        pass
+    try:
+        return len(file.getbuffer())
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _timed_chunks(name, chunks, file=None):
+    # Times each chunk as it is pulled from the reader, not the caller's work in between
+    chunks = iter(chunks)
+    while True:
+        with profiling.stage(name) as stage:
+            start = _position(file) if file is not None else None
+            chunk = next(chunks, None)
+            if chunk is None:
+                return
+            end = _position(file) if file is not None else None
+            stage.add(rows=len(chunk), bytes=end - start if start is not None and end is not None else None)
+        yield chunk
+
+
+def is_parquet(file):
+    file.seek(0)
+    magic = file.read(len(PARQUET_MAGIC))
+    file.seek(0)
+    return magic == PARQUET_MAGIC
+
+
+def iter_csv_chunks(file, chunksize=DEFAULT_CHUNKSIZE, encoding=None):
+    """Yield a binary CSV file as DataFrames of at most `chunksize` rows."""
+    encoding = encoding or sniff_encoding(file)
+    with pd.read_csv(file, encoding=encoding, encoding_errors="latin1_fallback", chunksize=chunksize) as reader:
+        yield from _timed_chunks("ingest.read_csv_chunk", reader, file)
+
+
+def read_csv(file, encoding=None):
+    encoding = encoding or sniff_encoding(file)
+    with profiling.stage("ingest.read_csv") as stage:
+        frame = pd.read_csv(file, encoding=encoding, encoding_errors="latin1_fallback")
+        stage.add(rows=len(frame), bytes=_size(file))
+    return frame
+
+
+def iter_parquet_chunks(file, chunksize=DEFAULT_CHUNKSIZE):
+    batches = (batch.to_pandas() for batch in pq.ParquetFile(file).iter_batches(batch_size=chunksize))
+    yield from _timed_chunks("ingest.read_parquet_chunk", batches)
+
+
+def sniff_format(file):
+    # "parquet", or the text encoding a CSV file will be read with
+    return "parquet" if is_parquet(file) else sniff_encoding(file)
+
+
+def iter_chunks(file, chunksize=DEFAULT_CHUNKSIZE, file_format=None):
+    """Yield a binary CSV or Parquet file as DataFrames of at most `chunksize` rows."""
+    file_format = file_format or sniff_format(file)
+    if file_format == "parquet":
+        return iter_parquet_chunks(file, chunksize)
+    return iter_csv_chunks(file, chunksize, file_format)
+
+
+def read_file(file):
+    if is_parquet(file):
+        with profiling.stage("ingest.read_parquet") as stage:
+            frame = pd.read_parquet(file)
+            stage.add(rows=len(frame), bytes=_size(file))
+        return frame
+    return read_csv(file)
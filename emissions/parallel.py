@@ -0,0 +1,177 @@
+import importlib.machinery
+import io
+import multiprocessing
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import repeat
+from pathlib import Path
+
+import pandas as pd
+
+from emissions import reference
+from emissions.distances import distance_model
+from emissions.engine import calculate_emissions
+from emissions.ingest import DEFAULT_CHUNKSIZE, read_file
+from emissions.resolver import DEFAULT_MIN_CONFIDENCE
+from emissions.streaming import PREVIEW_ROWS, EmissionTotals, stream_emissions
+
+FileResult = namedtuple("FileResult", ["name", "processed", "unresolved", "error"])
+StreamResult = namedtuple("StreamResult", ["name", "totals", "preview", "error"])
+
+# Reference tables of a spawned worker process, filled by _init_worker. Never used in the calling
+# process: Streamlit sessions are threads, so calculations running there get their own context
+_reference = {}
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def _load_context(workbook_path, cache_dir, routes=None, model=None, airports=None, emission_factors=None):
+    # Workers memory-map the Arrow reference cache instead of receiving pickled tables per task;
+    # callers in this process pass the tables they already hold
+    return {
+        "airports": reference.load_airports(workbook_path, cache_dir) if airports is None else airports,
+        "emission_factors": (
+            reference.load_emission_factors(workbook_path, cache_dir) if emission_factors is None else emission_factors
+        ),
+        "routes": routes,
+        "model": model,
+    }
+
+
+def _init_worker(workbook_path, cache_dir, model=None):
+    _reference.update(_load_context(workbook_path, cache_dir, None, model))
+
+
+def _payload(file):
+    # Files on disk are opened by the worker itself; uploads only exist in memory and travel as bytes
+    if isinstance(file, (str, os.PathLike)):
+        return Path(file).name, str(file)
+    return file.name, file.getvalue()
+
+
+def _open(name, source):
+    if isinstance(source, str):
+        return open(source, "rb")
+    file = io.BytesIO(source)
+    file.name = name
+    return file
+
+
+def _calculate_file(name, source, context=None):
+    context = context or _reference
+    try:
+        with _open(name, source) as file:
+            frame = read_file(file)
+        frame["filename"] = name
+        processed, unresolved = calculate_emissions(
+            frame, context["airports"], context["emission_factors"], routes=context["routes"], model=context["model"],
+        )
+        return FileResult(name, processed, unresolved, None)
+    except Exception as e:
+        return FileResult(name, None, None, str(e))
+
+
+def _stream_file(name, source, chunksize, resolver, min_confidence, context=None):
+    context = context or _reference
+    try:
+        with _open(name, source) as file:
+            totals, preview = stream_emissions(
+                [file], context["airports"], context["emission_factors"],
+                routes=context["routes"], chunksize=chunksize, resolver=resolver, min_confidence=min_confidence,
+                model=context["model"],
+            )
+        return StreamResult(name, totals, preview, None)
+    except Exception as e:
+        return StreamResult(name, None, None, str(e))
+
+
+def _spawn_without_page():
+    # Streamlit runs each page as a `__main__` module built from the script file, and spawned
+    # workers re-run the parent's `__main__` from its path: every worker would execute the page
+    # (main.py and all) in bare mode. A `__main__` spec makes multiprocessing skip that import.
+    streamlit = sys.modules.get("streamlit")
+    main = sys.modules.get("__main__")
+    if streamlit is None or main is None or getattr(main, "__spec__", None) is not None:
+        return
+    if streamlit.runtime.exists():
+        main.__spec__ = importlib.machinery.ModuleSpec("__main__", None)
+
+
+def _map_files(function, files, workers, routes, model, workbook_path, cache_dir, tables, *args):
+    # Workers without the route index still need its distance model; they get it by name
+    model = distance_model(model if model is not None else getattr(routes, "model", None)).name
+    payloads = [_payload(file) for file in files]
+    names = [name for name, _ in payloads]
+    sources = [source for _, source in payloads]
+    extra = [repeat(arg) for arg in args]
+
+    workers = max(1, min(workers or default_workers(), len(payloads)))
+    if workers == 1:
+        # A single worker runs in this process and can use the shared route index; the tables travel
+        # with the call so concurrent sessions never see each other's model or routes
+        context = _load_context(workbook_path, cache_dir, routes, model, *tables)
+        return list(map(partial(function, context=context), names, sources, *extra))
+
+    # Build the cache once up front so workers never race to parse the workbook
+    reference.load_table("airports", workbook_path, cache_dir)
+
+    # "spawn" keeps workers independent of the server's threads; map() preserves input order.
+    # The pool lives for one call, so each calculation pays the worker start-up (about a second)
+    _spawn_without_page()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(str(workbook_path), str(cache_dir), model),
+    ) as pool:
+        return list(pool.map(function, names, sources, *extra))
+
+
+def calculate_files(files, workers=None, routes=None, model=None,
+                    workbook_path=reference.WORKBOOK_PATH, cache_dir=reference.CACHE_DIR,
+                    airports=None, emission_factors=None):
+    """Read and calculate each file in a process pool; results come back in input order.
+
+    `routes`, `airports` and `emission_factors` are only used when everything runs in this
+    process (a single worker or file), where they save reloading the reference tables; the
+    distance model of `routes`, or `model`, applies either way.
+    """
+    return _map_files(
+        _calculate_file, files, workers, routes, model, workbook_path, cache_dir, (airports, emission_factors),
+    )
+
+
+def stream_files(files, chunksize=DEFAULT_CHUNKSIZE, workers=None, routes=None, resolver=None,
+                 min_confidence=DEFAULT_MIN_CONFIDENCE, model=None,
+                 workbook_path=reference.WORKBOOK_PATH, cache_dir=reference.CACHE_DIR,
+                 airports=None, emission_factors=None):
+    """Streaming variant of `calculate_files`: each worker keeps only running totals for its file."""
+    return _map_files(
+        _stream_file, files, workers, routes, model, workbook_path, cache_dir, (airports, emission_factors),
+        chunksize, resolver, min_confidence,
+    )
+
+
+def merge_results(results):
+    # Files are concatenated in upload order so row order does not depend on which worker finished first
+    processed = [result.processed for result in results if result.error is None]
+    if not processed:
+        return None, None
+    unresolved = [result.unresolved for result in results if result.error is None]
+    return pd.concat(processed, ignore_index=True), pd.concat(unresolved, ignore_index=True)
+
+
+def merge_streams(results):
+    totals = EmissionTotals()
+    previews = []
+    for result in results:
+        if result.error is None:
+            totals.merge(result.totals)
+            previews.append(result.preview)
+    preview = pd.concat(previews, ignore_index=True).head(PREVIEW_ROWS) if previews else pd.DataFrame()
+    return totals, preview
@@ -0,0 +1,186 @@
+import contextvars
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+LOGGER = logging.getLogger("emissions.profiling")
+
+# Profiler of the run in progress in this thread (each Streamlit script run has its own)
+_current = contextvars.ContextVar("profiler", default=None)
+
+
+def _max_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class Stage:
+    """Rows and bytes handled inside one timed stage; library code adds to it as it goes."""
+
+    def __init__(self, path, rows=None, bytes=None):
+        self.path = path
+        self.rows = rows
+        self.bytes = bytes
+        self.peak = 0
+
+    def add(self, rows=None, bytes=None):
+        if rows is not None:
+            self.rows = (self.rows or 0) + rows
+        if bytes is not None:
+            self.bytes = (self.bytes or 0) + bytes
+
+
+class _NullStage:
+    def add(self, rows=None, bytes=None):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Profiler:
+    """Named timers and counters for one run, aggregated by stage path.
+
+    Stages nest ("calculate/engine.distance") and repeat (one per chunk); repeated stages are
+    summed. `peak_bytes` is the most memory allocated since tracing started at any point during
+    the stage, and is only measured while tracemalloc is tracing, see `profile`.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = datetime.now(timezone.utc)
+        self.elapsed = None
+        self.stages = {}
+        self.counters = {}
+        self._stack = []
+        self._clock = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, rows=None, bytes=None):
+        parent = self._stack[-1] if self._stack else None
+        record = Stage(f"{parent.path}/{name}" if parent else name, rows, bytes)
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # The parent's peak so far is kept before the child resets the high-water mark
+            if parent is not None:
+                parent.peak = max(parent.peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._stack.append(record)
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - started
+            self._stack.pop()
+            if tracing:
+                record.peak = max(record.peak, tracemalloc.get_traced_memory()[1])
+                if parent is not None:
+                    parent.peak = max(parent.peak, record.peak)
+            self._record(record, seconds, tracing)
+
+    def _record(self, record, seconds, tracing):
+        entry = self.stages.setdefault(record.path, {
+            "stage": record.path, "calls": 0, "seconds": 0.0, "rows": None, "bytes": None, "peak_bytes": None,
+        })
+        entry["calls"] += 1
+        entry["seconds"] += seconds
+        if record.rows is not None:
+            entry["rows"] = (entry["rows"] or 0) + int(record.rows)
+        if record.bytes is not None:
+            entry["bytes"] = (entry["bytes"] or 0) + int(record.bytes)
+        if tracing:
+            entry["peak_bytes"] = max(entry["peak_bytes"] or 0, record.peak)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self._clock
+
+    def report(self):
+        stages = []
+        for entry in self.stages.values():
+            seconds = entry["seconds"]
+            stages.append({
+                **entry,
+                "rows_per_s": entry["rows"] / seconds if entry["rows"] and seconds else None,
+                "mb_per_s": entry["bytes"] / 1e6 / seconds if entry["bytes"] and seconds else None,
+            })
+        return {
+            "run": self.name,
+            "started": self.started.isoformat(timespec="seconds"),
+            "elapsed_s": self.elapsed if self.elapsed is not None else time.perf_counter() - self._clock,
+            "max_rss_bytes": _max_rss_bytes(),
+            "stages": stages,
+            "counters": dict(self.counters),
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.report(), indent=indent)
+
+    def log(self, logger=LOGGER, level=logging.INFO):
+        # One structured line per stage, so log pipelines can index stages without parsing nested JSON
+        report = self.report()
+        for stage in report["stages"]:
+            logger.log(level, json.dumps({"event": "stage", "run": self.name, "started": report["started"], **stage}))
+        logger.log(level, json.dumps({
+            "event": "run", "run": self.name, "started": report["started"], "elapsed_s": report["elapsed_s"],
+            "max_rss_bytes": report["max_rss_bytes"], "counters": report["counters"],
+        }))
+
+
+@contextmanager
+def profile(name, trace_memory=False):
+    """Make a new `Profiler` current for the code inside the block.
+
+    With `trace_memory` tracemalloc runs for the duration, which gives each stage a peak
+    memory figure but slows allocation-heavy code down; tracing is process-wide, so
+    concurrent runs see each other's allocations.
+    """
+    profiler = Profiler(name)
+    token = _current.set(profiler)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        yield profiler
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        _current.reset(token)
+        profiler.finish()
+
+
+def current():
+    return _current.get()
+
+
+def stage(name, rows=None, bytes=None):
+    """Time a stage of the current run; without an active profiler this does nothing."""
+    profiler = _current.get()
+    if profiler is None:
+        return _null_stage()
+    return profiler.stage(name, rows, bytes)
+
+
+@contextmanager
+def _null_stage():
+    yield _NULL_STAGE
+
+
+def count(name, n=1):
+    profiler = _current.get()
+    if profiler is not None:
+        profiler.count(name, n)
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+from emissions import profiling
+
+WORKBOOK_PATH = Path(__file__).parent.parent / "data" / "Avarni_Flight-Distance-Emissions-Calculator.xlsm"
+CACHE_DIR = Path(os.environ.get("BUSINESS_TRAVEL_CACHE_DIR", WORKBOOK_PATH.parent / ".cache"))
+
+# Reference tables read from the workbook and the read_excel options for each sheet
+SHEETS = {
+    "airports": {"sheet_name": "Airports"},
+    "emission_factors": {"sheet_name": "Emission Factors", "header": 2},
+}
+
+MANIFEST_NAME = "reference.json"
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_manifest(cache_dir):
+    try:
+        return json.loads((cache_dir / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_atomic(path, write):
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _table_path(cache_dir, name, fingerprint):
+    return cache_dir / f"{name}-{fingerprint[:16]}.arrow"
+
+
+def _remember(cache_dir, workbook_path, stat, fingerprint):
+    manifest = _read_manifest(cache_dir)
+    key = str(Path(workbook_path).resolve())
+    previous = manifest.get(key, {}).get("sha256")
+    manifest[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": fingerprint}
+    _write_atomic(cache_dir / MANIFEST_NAME, lambda tmp: tmp.write_text(json.dumps(manifest, indent=2)))
+    return previous
+
+
+def workbook_fingerprint(workbook_path=WORKBOOK_PATH, cache_dir=CACHE_DIR):
+    # The content hash is only recomputed when the workbook's size or mtime has moved
+    workbook_path = Path(workbook_path)
+    cache_dir = Path(cache_dir)
+    stat = workbook_path.stat()
+    entry = _read_manifest(cache_dir).get(str(workbook_path.resolve()), {})
+    if entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+        return entry["sha256"]
+    fingerprint = _file_hash(workbook_path)
+    if fingerprint == entry.get("sha256"):
+        # Touched but unchanged: keep the tables, just refresh the recorded mtime
+        _remember(cache_dir, workbook_path, stat, fingerprint)
+    return fingerprint
+
+
+def build_cache(workbook_path=WORKBOOK_PATH, cache_dir=CACHE_DIR):
+    """Parse the workbook once and write every reference sheet as an Arrow IPC file."""
+    workbook_path = Path(workbook_path)
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    stat = workbook_path.stat()
+    fingerprint = _file_hash(workbook_path)
+
+    with profiling.stage("reference.build_cache", bytes=stat.st_size), pd.ExcelFile(workbook_path) as workbook:
+        for name, options in SHEETS.items():
+            table = pa.Table.from_pandas(workbook.parse(**options), preserve_index=False)
+
+            def write(tmp, table=table):
+                with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+
+            _write_atomic(_table_path(cache_dir, name, fingerprint), write)
+
+    previous = _remember(cache_dir, workbook_path, stat, fingerprint)
+
+    # Drop tables left over from an older version of the workbook
+    if previous and previous != fingerprint:
+        for path in cache_dir.glob(f"*-{previous[:16]}.arrow"):
+            path.unlink(missing_ok=True)
+    return fingerprint
+
+
+def load_table(name, workbook_path=WORKBOOK_PATH, cache_dir=CACHE_DIR):
+    """Memory-map one cached reference table, rebuilding the cache if the workbook changed."""
+    cache_dir = Path(cache_dir)
+    with profiling.stage(f"reference.load_{name}") as stage:
+        fingerprint = workbook_fingerprint(workbook_path, cache_dir)
+        path = _table_path(cache_dir, name, fingerprint)
+        if not path.exists():
+            fingerprint = build_cache(workbook_path, cache_dir)
+            path = _table_path(cache_dir, name, fingerprint)
+        # The returned table's buffers point straight into the mapped file
+        table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+        stage.add(rows=table.num_rows, bytes=path.stat().st_size)
+    return table
+
+
+def load_airports(workbook_path=WORKBOOK_PATH, cache_dir=CACHE_DIR):
+    return load_table("airports", workbook_path, cache_dir).to_pandas()
+
+
+def load_emission_factors(workbook_path=WORKBOOK_PATH, cache_dir=CACHE_DIR):
+    return load_table("emission_factors", workbook_path, cache_dir).to_pandas()
@@ -0,0 +1,255 @@
+import copy
+import difflib
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from emissions import profiling
+from emissions.engine import OUTPUT_COLUMNS, airport_lookup, calculate_emissions
+
+AIRPORT_COLUMNS = ["Origin", "Destination"]
+REPORT_COLUMNS = ["Column", "Value", "Rows", "Match", "Method", "Confidence", "Accepted"]
+
+# Fuzzy matches below this confidence are reported as suggestions but not applied
+DEFAULT_MIN_CONFIDENCE = 0.85
+# Shorter values are codes; a near-miss on a three-letter code is just another airport
+MIN_FUZZY_LENGTH = 4
+FUZZY_CANDIDATES = 25
+
+# Confidence of each way a value can match, best first
+CONFIDENCE = {
+    "alias": 1.0,
+    "normalized": 1.0,
+    "ambiguous": 0.9,  # normalized key shared by several Lookups, e.g. "JOS" and "Jos"
+    "name": 0.95,
+    "contained": 0.9,  # every word of the value appears in one airport's name
+}
+NAME_FILLER = re.compile(r"\b(international|intl|airport|airfield|aerodrome|air base|airbase|airstrip)\b")
+
+
+def strip_filler(key):
+    # "london heathrow airport" -> "london heathrow"; words every airport name shares say nothing
+    return " ".join(NAME_FILLER.sub(" ", key).split()) or key
+
+
+def normalize_key(value):
+    # Case, accents, punctuation and repeated whitespace do not distinguish airports
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", text).split())
+
+
+def trigrams(key):
+    # Per-word trigrams padded like pg_trgm, so word starts weigh more than word ends
+    grams = set()
+    for word in key.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def read_aliases(file):
+    """Alias table from a CSV with the spelling in the first column and the Lookup it means in the second.
+
+    The table has no header; a first row whose second column reads "Lookup" is taken as one and skipped.
+    """
+    frame = pd.read_csv(file, dtype=str, header=None, skipinitialspace=True).dropna()
+    if frame.shape[1] < 2:
+        raise ValueError("The alias table needs two columns: the spelling used in uploads and the Airports Lookup it means")
+    if len(frame) and frame.iloc[0, 1].strip().casefold() == "lookup":
+        frame = frame.iloc[1:]
+    return dict(zip(frame.iloc[:, 0], frame.iloc[:, 1]))
+
+
+class AirportResolver:
+    """Maps the airport spellings found in uploads onto Lookups of the Airports sheet.
+
+    The index is built once from the sheet and covers the Lookups themselves (IATA codes and
+    cities), airport names and a user-supplied alias table, all under normalized keys. Values
+    with no normalized match fall back to a trigram search over the same keys.
+    """
+
+    def __init__(self, airports):
+        coordinates = airport_lookup(airports)
+        self.lookups = set(coordinates.index)
+        self.aliases = {}
+        self.invalid_aliases = {}
+        self._matches = {}
+        self._fuzzy = {}
+
+        keys = {}
+        counts = pd.Series([normalize_key(lookup) for lookup in coordinates.index]).value_counts()
+        for lookup in coordinates.index:
+            key = normalize_key(lookup)
+            keys.setdefault(key, (lookup, "normalized" if counts[key] == 1 else "ambiguous"))
+
+        # A name only resolves to its Lookup if that Lookup really points at this airport; the
+        # second airport listed under a city Lookup has no key of its own
+        first = airports.drop_duplicates("Lookup")
+        for name, lookup in zip(first["Name"], first["Lookup"]):
+            if pd.isna(name):
+                continue
+            key = normalize_key(name)
+            keys.setdefault(key, (lookup, "name"))
+            keys.setdefault(strip_filler(key), (lookup, "name"))
+        keys.pop("", None)
+        self._keys = keys
+
+        # Trigram postings: for every trigram, the positions of the keys containing it
+        self._key_list = list(dict.fromkeys(strip_filler(key) for key in keys))
+        postings = {}
+        sizes = np.zeros(len(self._key_list), dtype="int32")
+        for position, key in enumerate(self._key_list):
+            grams = trigrams(key)
+            sizes[position] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+        self._postings = {gram: np.asarray(positions, dtype="int32") for gram, positions in postings.items()}
+        self._sizes = sizes
+
+    def with_aliases(self, aliases):
+        """A resolver sharing this index that also knows `aliases` ({spelling: Lookup})."""
+        resolver = copy.copy(self)
+        resolver.aliases = {}
+        resolver.invalid_aliases = {}
+        for alias, lookup in (aliases or {}).items():
+            target, method, _ = self.match(lookup)
+            if method not in ("fuzzy", "unmatched") and normalize_key(alias):
+                resolver.aliases[normalize_key(alias)] = target
+            else:
+                resolver.invalid_aliases[alias] = lookup
+        resolver._matches = {}
+        return resolver
+
+    def _search(self, key):
+        # Best trigram candidates, re-ranked by edit similarity; memoized per key
+        if key in self._fuzzy:
+            return self._fuzzy[key]
+        grams = [self._postings[gram] for gram in trigrams(key) if gram in self._postings]
+        best = (None, "unmatched", 0.0)
+        if grams:
+            shared = np.bincount(np.concatenate(grams), minlength=len(self._key_list))
+            jaccard = shared / (self._sizes + len(trigrams(key)) - shared)
+            candidates = np.argpartition(-jaccard, min(FUZZY_CANDIDATES, len(jaccard) - 1))[:FUZZY_CANDIDATES]
+            words = set(key.split())
+            containing = set()
+            for position in candidates[shared[candidates] > 0]:
+                candidate = self._key_list[position]
+                lookup = self._keys[candidate][0]
+                score = difflib.SequenceMatcher(None, key, candidate).ratio()
+                if words <= set(candidate.split()):
+                    containing.add(lookup)
+                if score > best[2]:
+                    best = (lookup, "fuzzy", score)
+            # "changi" is a whole word of exactly one airport name: stronger than any spelling likeness
+            if len(containing) == 1 and best[2] < CONFIDENCE["contained"]:
+                best = (containing.pop(), "contained", CONFIDENCE["contained"])
+        self._fuzzy[key] = best
+        return best
+
+    def match(self, value):
+        """(Lookup, method, confidence) for one value; Lookup is None when nothing comes close."""
+        if value in self.lookups:
+            return value, "exact", 1.0
+        key = normalize_key(value)
+        if key in self.aliases:
+            return self.aliases[key], "alias", CONFIDENCE["alias"]
+        if key in self._keys:
+            lookup, method = self._keys[key]
+            return lookup, method, CONFIDENCE[method]
+        stripped = strip_filler(key)
+        if stripped in self._keys:
+            lookup, method = self._keys[stripped]
+            return lookup, method, min(CONFIDENCE[method], CONFIDENCE["name"])
+        if len(key.replace(" ", "")) < MIN_FUZZY_LENGTH:
+            return None, "unmatched", 0.0
+        return self._search(stripped)
+
+    def resolve(self, values, min_confidence=DEFAULT_MIN_CONFIDENCE):
+        """Match the distinct strings in `values` and return a report indexed by value."""
+        values = pd.Series(values).dropna()
+        distinct = pd.unique(values.astype(str))
+        matches = []
+        for value in distinct:
+            if value not in self._matches:
+                self._matches[value] = self.match(value)
+            matches.append(self._matches[value])
+        report = pd.DataFrame(matches, index=pd.Index(distinct, name="Value"), columns=["Match", "Method", "Confidence"])
+        report["Accepted"] = report["Match"].notna() & (report["Confidence"] >= min_confidence)
+        return report
+
+
+def _add_categories(frame, rewritten):
+    # Categorical airport columns (Parquet written by pandas, e.g. a compact export) only take
+    # values that are already categories, so the matched Lookups are added first
+    for column, mapping in rewritten.items():
+        values = frame[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            new = pd.Index(list(mapping.values())).unique().difference(values.cat.categories)
+            if len(new):
+                frame[column] = values.cat.add_categories(new)
+    return frame
+
+
+def resolve_unresolved(processed, unresolved, resolver, airports, emission_factors, routes=None,
+                       min_confidence=DEFAULT_MIN_CONFIDENCE, model=None):
+    """Second pass over the rows `calculate_emissions` could not place.
+
+    Distinct unresolved Origin/Destination values are matched once each; rows whose values
+    matched with at least `min_confidence` are rewritten to the Lookup and recalculated.
+    Returns the updated processed and unresolved frames and a report of every value tried.
+    """
+    with profiling.stage("resolver.resolve_unresolved", rows=len(processed)):
+        columns = [column for column in AIRPORT_COLUMNS if column in unresolved]
+        report = []
+        rewritten = {}
+        for column in columns:
+            values = processed.loc[unresolved[column].to_numpy(), column].dropna().astype(str)
+            if values.empty:
+                continue
+            matches = resolver.resolve(values, min_confidence)
+            matches.insert(0, "Rows", values.value_counts())
+            matches.insert(0, "Column", column)
+            report.append(matches.reset_index())
+            accepted = matches.loc[matches["Accepted"], "Match"]
+            if not accepted.empty:
+                rewritten[column] = accepted.to_dict()
+        report = pd.concat(report, ignore_index=True)[REPORT_COLUMNS] if report else pd.DataFrame(columns=REPORT_COLUMNS)
+        if not rewritten:
+            return processed, unresolved, report
+
+        # Cached frames may be shared, so changes go to copies
+        changed = np.zeros(len(processed), dtype=bool)
+        inputs = processed.drop(columns=[c for c in OUTPUT_COLUMNS if c in processed.columns])
+        updates = {}
+        for column, mapping in rewritten.items():
+            mask = unresolved[column].to_numpy() & processed[column].astype(str).isin(list(mapping)).to_numpy()
+            changed |= mask
+            updates[column] = mask
+        positions = np.flatnonzero(changed)
+        subset = _add_categories(inputs.iloc[positions].copy(), rewritten)
+        for column, mapping in rewritten.items():
+            mask = updates[column][positions]
+            subset.loc[mask, column] = subset.loc[mask, column].astype(str).map(mapping).to_numpy()
+        recalculated, still_unresolved = calculate_emissions(subset, airports, emission_factors, routes=routes, model=model)
+
+        processed = _add_categories(processed.copy(), rewritten)
+        for column in recalculated.columns:
+            if column in processed.columns:
+                processed.iloc[positions, processed.columns.get_loc(column)] = recalculated[column].to_numpy()
+        unresolved = unresolved.copy()
+        unresolved.iloc[positions] = still_unresolved[unresolved.columns].to_numpy()
+        return processed, unresolved, report
+
+
+def combine_reports(reports):
+    # One row per (column, value) across files or chunks
+    reports = [report for report in reports if report is not None and not report.empty]
+    if not reports:
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+    combined = pd.concat(reports, ignore_index=True)
+    first = combined.groupby(["Column", "Value"], sort=False).first()
+    first["Rows"] = combined.groupby(["Column", "Value"], sort=False)["Rows"].sum()
+    return first.reset_index()[REPORT_COLUMNS].sort_values(["Column", "Rows"], ascending=[True, False], ignore_index=True)
@@ -0,0 +1,86 @@
+import hashlib
+import os
+
+from emissions import profiling, reference
+from emissions.distances import distance_model
+from emissions.parallel import FileResult, calculate_files
+from emissions.store import SharedStore
+
+DEFAULT_MAX_BYTES = int(os.environ.get("BUSINESS_TRAVEL_RESULT_CACHE_MB", 512)) * 1024 * 1024
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    else:
+        digest.update(file.getvalue())
+    return digest.hexdigest()
+
+
+def _frame_bytes(result):
+    return int(result.processed.memory_usage(deep=True).sum() + result.unresolved.memory_usage(deep=True).sum())
+
+
+class ResultCache(SharedStore):
+    """Processed frames per file, keyed by content hash and evicted least-recently-used past `max_bytes`.
+
+    Cached frames are shared between callers and must not be modified in place.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(max_bytes)
+
+    def get(self, key, name=None):
+        result = super().get(key)
+        if result is not None and name is not None and name != result.name:
+            # Same content uploaded under another name: relabel the provenance column
+            result = FileResult(name, result.processed.assign(filename=name), result.unresolved, None)
+        return result
+
+    def put(self, key, result):
+        super().put(key, result, _frame_bytes(result))
+
+    def stats(self):
+        stats = super().stats()
+        stats["files"] = stats.pop("entries")
+        return stats
+
+
+def result_keys(files, workbook_path=reference.WORKBOOK_PATH, cache_dir=reference.CACHE_DIR, model=None):
+    # One key per file: its bytes, the workbook version and the distance model they were calculated with
+    fingerprint = reference.workbook_fingerprint(workbook_path, cache_dir)
+    model = distance_model(model).name
+    with profiling.stage("results.content_hash"):
+        return [f"{content_hash(file)}-{fingerprint}-{model}" for file in files]
+
+
+def calculate_cached(files, cache, workers=None, routes=None, keys=None, model=None,
+                     workbook_path=reference.WORKBOOK_PATH, cache_dir=reference.CACHE_DIR,
+                     airports=None, emission_factors=None):
+    """`calculate_files`, but only files whose content is not already in `cache` are calculated.
+
+    Results are keyed on the file bytes, the workbook version and the distance model (`result_keys`, or `keys` when
+    already computed) and come back in input order, together with the number of files that
+    were served from the cache.
+    """
+    if model is None and routes is not None:
+        model = routes.model
+    keys = keys or result_keys(files, workbook_path, cache_dir, model)
+    names = [os.path.basename(getattr(file, "name", str(file))) for file in files]
+    results = [cache.get(key, name) for key, name in zip(keys, names)]
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    profiling.count("results.reused_files", len(files) - len(missing))
+    if missing:
+        computed = calculate_files(
+            [files[i] for i in missing], workers=workers, routes=routes, model=model,
+            workbook_path=workbook_path, cache_dir=cache_dir, airports=airports, emission_factors=emission_factors,
+        )
+        for i, result in zip(missing, computed):
+            if result.error is None:
+                cache.put(keys[i], result)
+            results[i] = result
+    return results, len(files) - len(missing)
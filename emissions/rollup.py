@@ -0,0 +1,208 @@
+import numpy as np
+import pandas as pd
+
+from emissions import profiling
+
+STATS = ["sum", "count", "min", "max"]
+
+# Columns of every processed frame; their values are bounded by the reference data and the uploads
+CORE_DIMENSIONS = ["Origin", "Destination", "Route", "Class", "Return_trip", "filename"]
+# Tag columns with more distinct values than this (trip IDs, employees, dates) are not dimensions:
+# their tables would grow with the rows, and they cannot be read on a chart anyway
+MAX_TAG_VALUES = 1_000
+AGGREGATIONS = ["sum", "mean", "median", "min", "max"]
+
+# Median sketch: values are counted in logarithmic buckets, so every estimate is within
+# SKETCH_ACCURACY of a value that is really in the group (DDSketch-style, mergeable by adding counts)
+SKETCH_ACCURACY = 0.005
+_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+_LOG_GAMMA = np.log(_GAMMA)
+
+
+def route_labels(frame):
+    # "Origin ➝ Destination" as a categorical, labelled once per distinct pair rather than once per row
+    origin_codes, origins = pd.factorize(frame["Origin"])
+    dest_codes, destinations = pd.factorize(frame["Destination"])
+    known = (origin_codes >= 0) & (dest_codes >= 0)  # like string concatenation, an empty end gives no route
+    width = max(len(destinations), 1)
+    pair_codes, pairs = pd.factorize(origin_codes[known].astype("int64") * width + dest_codes[known])
+    origin_pos, dest_pos = np.divmod(pairs, width)
+    categories = [f"{origins[o]} ➝ {destinations[d]}" for o, d in zip(origin_pos.tolist(), dest_pos.tolist())]
+    codes = np.full(len(frame), -1, dtype="int64")
+    codes[known] = pair_codes
+    return pd.Series(pd.Categorical.from_codes(codes, categories), index=frame.index, name="Route")
+
+
+# Bucket keys are packed next to the group code in one int64 so counting is a single value_counts
+_KEY_BIAS = 100_000
+_KEY_SHIFT = 2 * _KEY_BIAS
+_KEY_SPAN = 2 * _KEY_SHIFT
+
+
+def _sketch_keys(values):
+    # Signed logarithmic bucket of each value, shifted to be positive; -1 marks NaN and infinities
+    magnitude = np.abs(values)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        key = np.ceil(np.log(magnitude) / _LOG_GAMMA)
+    finite = np.isfinite(values)
+    signed = np.where(magnitude == 0, 0, np.sign(values) * (np.where(finite & (magnitude > 0), key, 0) + _KEY_BIAS))
+    return np.where(finite, signed + _KEY_SHIFT, -1).astype("int64")
+
+
+def _sketch_value(keys):
+    # Representative value of each bucket, within SKETCH_ACCURACY of every value counted in it
+    signed = keys - _KEY_SHIFT
+    value = np.sign(signed) * 2 * _GAMMA**(np.abs(signed) - _KEY_BIAS) / (_GAMMA + 1)
+    return np.where(signed == 0, 0.0, value)
+
+
+def _sketch(codes, groups, keys, measure):
+    valid = keys >= 0
+    packed = codes[valid].astype("int64") * _KEY_SPAN + keys[valid]
+    counts = pd.Series(packed).value_counts(sort=False)
+    packed = counts.index.to_numpy()
+    return pd.DataFrame({
+        "group": groups[packed // _KEY_SPAN],
+        "measure": measure,
+        "value": _sketch_value(packed % _KEY_SPAN),
+        "count": counts.to_numpy(),
+    })
+
+
+class RollupCube:
+    """Per-dimension aggregates of a processed frame, built once and merged across chunks.
+
+    For every categorical dimension (Class, Origin, Destination, Route, filename, tag columns)
+    and numeric measure it keeps sum/count/min/max per value, plus a bucket sketch for medians.
+    Tag columns with more than MAX_TAG_VALUES values, in one frame or once merged, are left out
+    and listed in `skipped`, so the cube stays bounded however many rows are streamed through it.
+    """
+
+    def __init__(self, tables=None, sketches=None, totals=None, rows=0, skipped=None):
+        self.tables = tables or {}
+        self.sketches = sketches or {}
+        self.totals = totals if totals is not None else pd.Series(dtype="float64")
+        self.rows = rows
+        self.skipped = set(skipped or ())
+
+    @property
+    def dimensions(self):
+        return list(self.tables)
+
+    @property
+    def measures(self):
+        return list(self.totals.index)
+
+    @classmethod
+    def from_frame(cls, frame):
+        with profiling.stage("rollup.build", rows=len(frame)):
+            if "Route" not in frame and {"Origin", "Destination"} <= set(frame.columns):
+                frame = frame.assign(Route=route_labels(frame))
+            measures = frame.select_dtypes(include=["number"]).columns.tolist()
+            dimensions = [c for c in frame.select_dtypes(include=["object", "category", "string"]).columns if c not in measures]
+            values = frame[measures]
+            keys = {m: _sketch_keys(values[m].to_numpy(dtype="float64")) for m in measures}
+
+            tables = {}
+            sketches = {}
+            skipped = set()
+            for dimension in dimensions:
+                # Empty dimension values are kept as their own group, like groupby(dropna=False)
+                codes, uniques = pd.factorize(frame[dimension], use_na_sentinel=False)
+                if dimension not in CORE_DIMENSIONS and len(uniques) > MAX_TAG_VALUES:
+                    skipped.add(dimension)
+                    continue
+                uniques = np.asarray(uniques, dtype=object)
+                table = values.groupby(codes, sort=False).agg(STATS)
+                table.index = pd.Index(uniques[table.index], dtype=object, name=dimension)
+                tables[dimension] = table
+
+                sketches[dimension] = pd.concat(
+                    [_sketch(codes, uniques, keys[m], m) for m in measures], ignore_index=True
+                )
+
+            totals = values.sum()
+        return cls(tables, sketches, totals, len(frame), skipped)
+
+    def _skip(self, dimension):
+        self.tables.pop(dimension, None)
+        self.sketches.pop(dimension, None)
+        self.skipped.add(dimension)
+
+    def merge(self, other):
+        """Combine with a cube built from other rows (another chunk or file)."""
+        with profiling.stage("rollup.merge", rows=other.rows):
+            # A tag left out of either side cannot be completed from the other's rows
+            for dimension in other.skipped:
+                self._skip(dimension)
+            for dimension, table in other.tables.items():
+                if dimension in self.skipped:
+                    continue
+                if dimension not in self.tables:
+                    self.tables[dimension] = table
+                    self.sketches[dimension] = other.sketches[dimension]
+                    continue
+                combined = pd.concat([self.tables[dimension], table])
+                groups = combined.groupby(level=0, dropna=False, sort=False)
+                merged = groups.sum()
+                for stat in ("min", "max"):
+                    columns = [column for column in combined.columns if column[1] == stat]
+                    merged[columns] = getattr(groups[columns], stat)()
+                merged.index.name = dimension
+                if dimension not in CORE_DIMENSIONS and len(merged) > MAX_TAG_VALUES:
+                    self._skip(dimension)
+                    continue
+                self.tables[dimension] = merged
+
+                sketch = pd.concat([self.sketches[dimension], other.sketches[dimension]], ignore_index=True)
+                self.sketches[dimension] = sketch.groupby(["group", "measure", "value"], dropna=False, sort=False)["count"].sum().reset_index()
+            self.totals = self.totals.add(other.totals, fill_value=0)
+            self.rows += other.rows
+        return self
+
+    def summary(self, dimension, measures=None):
+        """One row per value of `dimension` with each measure's sum, count, mean, median, min and max.
+
+        Medians come from the bucket sketch, so they are within SKETCH_ACCURACY like `aggregate`'s.
+        """
+        columns = {}
+        for measure in measures or self.measures:
+            for aggregation in ("sum", "count", "mean", "median", "min", "max"):
+                if aggregation == "count":
+                    values = self.tables[dimension][(measure, "count")].sort_index()
+                    values = values[values.index.notna()]
+                else:
+                    values = self.aggregate(dimension, measure, aggregation)
+                columns[f"{measure}_{aggregation}"] = values
+        return pd.DataFrame(columns).rename_axis(dimension).reset_index()
+
+    def total(self, measure):
+        return self.totals.get(measure, 0.0)
+
+    def median(self, dimension, measure):
+        sketch = self.sketches[dimension]
+        sketch = sketch[sketch["measure"] == measure].sort_values(["group", "value"])
+        groups = sketch.groupby("group", dropna=False, sort=False)["count"]
+        middle = (groups.transform("sum") - 1) / 2
+        cumulative = groups.cumsum()
+        # Like pandas, an even-sized group averages its two middle values
+        lower = sketch[cumulative > np.floor(middle)].groupby("group", dropna=False, sort=False)["value"].first()
+        upper = sketch[cumulative > np.ceil(middle)].groupby("group", dropna=False, sort=False)["value"].first()
+        return (lower + upper) / 2
+
+    def aggregate(self, dimension, measure, aggregation="sum", dropna=True):
+        """Equivalent of `df.groupby(dimension)[measure].agg(aggregation)` without touching the rows."""
+        table = self.tables[dimension]
+        if aggregation == "mean":
+            result = table[(measure, "sum")] / table[(measure, "count")].where(table[(measure, "count")] > 0)
+        elif aggregation == "median":
+            result = self.median(dimension, measure).reindex(table.index)
+        else:
+            result = table[(measure, aggregation)]
+            if aggregation in ("min", "max"):
+                result = result.where(table[(measure, "count")] > 0)
+        result = result.rename(measure)
+        result.index.name = dimension
+        if dropna:
+            result = result[result.index.notna()]
+        return result.sort_index()
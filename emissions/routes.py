@@ -0,0 +1,110 @@
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+
+from emissions import reference
+from emissions.distances import distance_model
+
+DEFAULT_MAXSIZE = 100_000
+
+
+class RouteIndex:
+    """Bounded LRU of one-way distances keyed on (origin Lookup, destination Lookup).
+
+    Distances are computed with `model`; an index only ever holds one model's distances.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, path=None, model=None):
+        self.maxsize = maxsize
+        self.model = distance_model(model)
+        self.path = Path(path) if path else None
+        self.hits = 0
+        self.misses = 0
+        self._distances = OrderedDict()
+        self._dirty = False
+        self._lock = threading.Lock()
+        if self.path and self.path.exists():
+            self._load()
+
+    def __len__(self):
+        return len(self._distances)
+
+    def lookup(self, origins, destinations, origin_lat, origin_lon, dest_lat, dest_lon):
+        # Each argument holds one entry per distinct route; only routes not seen before are computed
+        with self._lock:
+            distances = np.empty(len(origins), dtype="float64")
+            missing = []
+            for i, key in enumerate(zip(origins, destinations)):
+                distance = self._distances.get(key)
+                if distance is None:
+                    missing.append(i)
+                else:
+                    self._distances.move_to_end(key)
+                    distances[i] = distance
+            self.hits += len(origins) - len(missing)
+            self.misses += len(missing)
+
+            if missing:
+                missing = np.asarray(missing)
+                computed = self.model.distance_km(
+                    np.asarray(origin_lat)[missing], np.asarray(origin_lon)[missing],
+                    np.asarray(dest_lat)[missing], np.asarray(dest_lon)[missing],
+                )
+                distances[missing] = computed
+                for i, distance in zip(missing, computed.tolist()):
+                    self._distances[(origins[i], destinations[i])] = distance
+                while len(self._distances) > self.maxsize:
+                    self._distances.popitem(last=False)
+                self._dirty = True
+            return distances
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "routes": len(self._distances),
+            "maxsize": self.maxsize,
+            "model": self.model.name,
+        }
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            # Least recently used first, so reloading restores the eviction order
+            table = pa.table({
+                "origin": [key[0] for key in self._distances],
+                "destination": [key[1] for key in self._distances],
+                "distance_km": pa.array(list(self._distances.values()), type=pa.float64()),
+            })
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+    def _load(self):
+        try:
+            table = pa.ipc.open_file(pa.memory_map(str(self.path), "r")).read_all()
+        except (OSError, pa.ArrowInvalid):
+            return  # an unreadable cache is simply rebuilt
+        keys = zip(table["origin"].to_pylist(), table["destination"].to_pylist())
+        self._distances = OrderedDict(zip(keys, table["distance_km"].to_pylist()))
+        while len(self._distances) > self.maxsize:
+            self._distances.popitem(last=False)
+
+
+def open_route_index(maxsize=DEFAULT_MAXSIZE, workbook_path=reference.WORKBOOK_PATH, cache_dir=reference.CACHE_DIR,
+                     model=None):
+    # Stored distances depend on the airport coordinates and the distance model (and its kernel's
+    # revision), so the file follows all of them
+    fingerprint = reference.workbook_fingerprint(workbook_path, cache_dir)
+    model = distance_model(model)
+    return RouteIndex(maxsize, Path(cache_dir) / f"routes-{fingerprint[:16]}-{model.cache_name}.arrow", model)
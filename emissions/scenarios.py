@@ -0,0 +1,155 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from emissions import profiling
+from emissions.engine import factor_lookup, passenger_counts
+
+BASELINE = "Emission Factors sheet"
+
+# Separators accepted between the two ends of a dropped route, e.g. "LHR > JFK"
+ROUTE_SEPARATORS = (">", "➝", "→")
+
+# A what-if: another factor table (None for the sheet), a multiplier on every factor, classes
+# priced as other classes, and airports or routes taken out of the travel ("LHR; JFK > SIN")
+Scenario = namedtuple("Scenario", ["name", "factors", "scale", "substitutions", "dropped"],
+                      defaults=(None, 1.0, None, ""))
+# Rows are counted once each: priced, unpriced (no factor for the class), dropped, or uncalculated
+# (no distance in the calculation, e.g. an unknown airport or a class the sheet has no factor for)
+ScenarioResult = namedtuple(
+    "ScenarioResult", ["name", "emissions", "by_class", "priced_rows", "unpriced_rows", "dropped_rows", "uncalculated_rows"]
+)
+
+
+def read_factor_table(file):
+    """Class -> factor from a CSV or Excel table laid out like the Emission Factors sheet.
+
+    Uses the "Class" and "Factor CO2e Value" columns when present, otherwise the first two columns.
+    """
+    name = getattr(file, "name", str(file))
+    if os.path.splitext(name)[1].lower() in (".xlsx", ".xlsm", ".xls"):
+        frame = pd.read_excel(file)
+    else:
+        frame = pd.read_csv(file)
+    if {"Class", "Factor CO2e Value"} <= set(frame.columns):
+        frame = frame[["Class", "Factor CO2e Value"]]
+    elif frame.shape[1] >= 2:
+        frame = frame.iloc[:, :2]
+    else:
+        raise ValueError("The factor table needs a Class column and a factor column (kg CO2e per passenger-km)")
+    frame.columns = ["Class", "Factor CO2e Value"]
+    frame["Factor CO2e Value"] = pd.to_numeric(frame["Factor CO2e Value"], errors="coerce")
+    frame = frame.dropna()
+    if frame.empty:
+        raise ValueError("The factor table has no numeric factors")
+    return factor_lookup(frame)
+
+
+def parse_dropped(text):
+    # "LHR; JFK > SIN" -> airports {"LHR"} and routes {("JFK", "SIN")}
+    airports, routes = set(), set()
+    for item in str(text or "").replace(",", ";").split(";"):
+        for separator in ROUTE_SEPARATORS:
+            if separator in item:
+                origin, _, destination = item.partition(separator)
+                routes.add((origin.strip(), destination.strip()))
+                break
+        else:
+            if item.strip():
+                airports.add(item.strip())
+    return airports, routes
+
+
+class ScenarioBase:
+    """The resolved distances of one calculation, kept so scenarios only redo the factor join.
+
+    Each row is reduced to its class code, origin and destination codes and the passenger-km the
+    emissions were priced on (one passenger when none was entered, like the engine).
+    """
+
+    def __init__(self, business_data):
+        with profiling.stage("scenarios.base", rows=len(business_data)):
+            # Categorical columns factorize on their codes; the labels are kept as plain objects
+            self.class_codes, classes = pd.factorize(business_data["Class"])
+            self.origin_codes, origins = pd.factorize(business_data["Origin"])
+            self.dest_codes, destinations = pd.factorize(business_data["Destination"])
+            self.classes, self.origins, self.destinations = (
+                pd.Index(np.asarray(labels, dtype=object)) for labels in (classes, origins, destinations)
+            )
+            distance = business_data["Distance_km"].to_numpy(dtype="float64", na_value=np.nan)
+            self.pkm = distance * passenger_counts(business_data).to_numpy(dtype="float64", na_value=np.nan)
+            self.located = ~np.isnan(self.pkm)
+            self.rows = len(business_data)
+
+    def _dropped_rows(self, dropped):
+        airports, routes = parse_dropped(dropped)
+        if not airports and not routes:
+            return np.zeros(self.rows, dtype=bool)
+        origin_hit = np.append(self.origins.isin(airports), False)[self.origin_codes]
+        dest_hit = np.append(self.destinations.isin(airports), False)[self.dest_codes]
+        dropped = origin_hit | dest_hit
+        if routes:
+            origin_pos = {value: i for i, value in enumerate(self.origins)}
+            dest_pos = {value: i for i, value in enumerate(self.destinations)}
+            for origin, destination in routes:
+                if origin in origin_pos and destination in dest_pos:
+                    dropped |= (self.origin_codes == origin_pos[origin]) & (self.dest_codes == dest_pos[destination])
+        return dropped
+
+    def price(self, scenario, factors):
+        """Emissions of every row under `scenario`, with `factors` the Class -> factor table it uses."""
+        # Substitutions and the factor join happen once per distinct class, then gather per row
+        substitutions = scenario.substitutions or {}
+        priced_as = self.classes.map(lambda value: substitutions.get(value, value))
+        class_factor = factors.reindex(priced_as).to_numpy(dtype="float64") * scenario.scale
+        factor = np.append(class_factor, np.nan)[self.class_codes]
+        dropped = self._dropped_rows(scenario.dropped)
+        emissions = np.where(dropped, 0.0, self.pkm * factor)
+        return emissions, priced_as, dropped
+
+    def reprice(self, scenario, factor_tables):
+        """Price `scenario`; `factor_tables` maps table names (including BASELINE) to Class -> factor."""
+        table = scenario.factors or BASELINE
+        if table not in factor_tables:
+            raise ValueError(f"Scenario {scenario.name!r} uses the factor table {table!r}, which is not loaded")
+        with profiling.stage("scenarios.reprice", rows=self.rows):
+            emissions, priced_as, dropped = self.price(scenario, factor_tables[table])
+            priced = self.located & ~dropped & ~np.isnan(emissions)
+            valid = self.class_codes >= 0
+            by_class = pd.Series(
+                np.bincount(self.class_codes[valid], weights=np.nan_to_num(emissions[valid]), minlength=len(self.classes)),
+                index=priced_as,
+            ).groupby(level=0, sort=False).sum()
+            return ScenarioResult(
+                scenario.name,
+                float(np.nansum(emissions)),
+                by_class,
+                int(priced.sum()),
+                int((self.located & ~dropped & np.isnan(emissions)).sum()),
+                int(dropped.sum()),
+                int((~self.located & ~dropped).sum()),
+            )
+
+
+def compare_scenarios(base, scenarios, factor_tables):
+    """Summary and per-class emissions of each scenario, next to the baseline (the sheet as calculated)."""
+    results = [base.reprice(Scenario("Baseline"), factor_tables)]
+    results += [base.reprice(scenario, factor_tables) for scenario in scenarios]
+    baseline = results[0].emissions
+    summary = pd.DataFrame({
+        "Scenario": [result.name for result in results],
+        "Emissions": [result.emissions for result in results],
+        "Change": [result.emissions - baseline for result in results],
+        "Change %": [(result.emissions - baseline) / baseline if baseline else np.nan for result in results],
+        "Priced rows": [result.priced_rows for result in results],
+        "Unpriced rows": [result.unpriced_rows for result in results],
+        "Dropped rows": [result.dropped_rows for result in results],
+        "Uncalculated rows": [result.uncalculated_rows for result in results],
+    })
+    by_class = pd.concat(
+        [result.by_class.rename("Emissions").rename_axis("Class").reset_index().assign(Scenario=result.name) for result in results],
+        ignore_index=True,
+    )
+    return summary, by_class
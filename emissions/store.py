@@ -0,0 +1,149 @@
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from emissions import reference
+from emissions.engine import airport_lookup
+
+class SharedStore:
+    """Thread-safe values shared by every session of the server, evicted least-recently-used past `max_bytes`.
+
+    `get_or_create` computes a missing value once even when several sessions ask for it at the
+    same time. Stored values are shared, not copied, and must not be modified by callers.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._values.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        if size > self.max_bytes:
+            return  # larger than the whole store; not worth evicting everything else for
+        with self._lock:
+            if key in self._values:
+                self.bytes -= self._values.pop(key)[1]
+            self._values[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._values.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def get_or_create(self, key, create, size):
+        """The stored value for `key`, or `create()` stored with `size(value)` bytes."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            pending = self._pending.setdefault(key, threading.Lock())
+        with pending:
+            # Another session may have created it while this one waited
+            with self._lock:
+                entry = self._values.get(key)
+            if entry is not None:
+                return entry[0]
+            try:
+                value = create()
+                SharedStore.put(self, key, value, size(value))
+            finally:
+                with self._lock:
+                    self._pending.pop(key, None)
+        return value
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._values),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+# One set of reference tables per workbook for the whole process
+_reference = {}
+_reference_lock = threading.Lock()
+
+
+class ReferenceData:
+    """The reference tables of one workbook version, each loaded the first time a page asks for it.
+
+    Pages pay only for the tables they show: the calculator's upload form needs none of them and
+    the background data page one sheet per view. Once loaded, a table is kept for the process.
+    """
+
+    def __init__(self, fingerprint, workbook_path=reference.WORKBOOK_PATH, cache_dir=reference.CACHE_DIR):
+        self.fingerprint = fingerprint
+        self.workbook_path = workbook_path
+        self.cache_dir = cache_dir
+        self._values = {}
+        self._lock = threading.RLock()
+
+    def _get(self, name, load):
+        value = self._values.get(name)
+        if value is None:
+            with self._lock:
+                value = self._values.get(name)
+                if value is None:
+                    value = self._values[name] = load()
+        return value
+
+    def table(self, name):
+        """The memory-mapped Arrow table of one sheet (see reference.SHEETS)."""
+        return self._get(("table", name), lambda: reference.load_table(name, self.workbook_path, self.cache_dir))
+
+    @property
+    def airports(self):
+        return self._get("airports", lambda: self.table("airports").to_pandas(split_blocks=True))
+
+    @property
+    def emission_factors(self):
+        return self._get("emission_factors", lambda: self.table("emission_factors").to_pandas(split_blocks=True))
+
+    @property
+    def coordinates(self):
+        return self._get("coordinates", lambda: airport_lookup(self.airports))
+
+
+def shared_reference(workbook_path=reference.WORKBOOK_PATH, cache_dir=reference.CACHE_DIR):
+    """Reference tables held once per process and replaced when the workbook changes.
+
+    The Arrow tables are memory-mapped from the reference cache, so their buffers live in the
+    OS page cache and are shared with worker processes. The pandas frames are converted once,
+    on first use, and handed to every session as the same objects; numeric columns stay
+    read-only views of the mapped buffers where Arrow allows it.
+    """
+    key = (str(Path(workbook_path).resolve()), str(Path(cache_dir).resolve()))
+    fingerprint = reference.workbook_fingerprint(workbook_path, cache_dir)
+    current = _reference.get(key)
+    if current is not None and current.fingerprint == fingerprint:
+        return current
+    with _reference_lock:
+        current = _reference.get(key)
+        if current is None or current.fingerprint != fingerprint:
+            current = ReferenceData(fingerprint, workbook_path, cache_dir)
+            _reference[key] = current
+    return current
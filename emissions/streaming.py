@@ -0,0 +1,125 @@
+import os
+
+import pandas as pd
+
+from emissions.engine import calculate_emissions
+from emissions.ingest import DEFAULT_CHUNKSIZE, iter_chunks, sniff_format
+from emissions.resolver import DEFAULT_MIN_CONFIDENCE, REPORT_COLUMNS, combine_reports, resolve_unresolved
+from emissions.rollup import RollupCube
+
+PREVIEW_ROWS = 1_000
+
+
+class EmissionTotals:
+    """Running totals and a rollup cube of the processed rows, updated one chunk at a time."""
+
+    def __init__(self):
+        self.rows = 0
+        self.unresolved_rows = 0
+        self.cube = RollupCube()
+        self.unresolved_values = {}
+        self.resolution = pd.DataFrame(columns=REPORT_COLUMNS)
+        self.files = {}
+
+    @property
+    def emissions(self):
+        return self.cube.total("Emissions")
+
+    @property
+    def distance_km(self):
+        return self.cube.total("Distance_km")
+
+    @property
+    def passenger_distance_pkm(self):
+        return self.cube.total("Passenger_distance_pkm")
+
+    @property
+    def by_class(self):
+        return self._by("Class")
+
+    @property
+    def by_route(self):
+        return self._by("Route")
+
+    def _by(self, dimension):
+        if dimension not in self.cube.tables:
+            return pd.Series(dtype="float64", name="Emissions")
+        return self.cube.aggregate(dimension, "Emissions", "sum")
+
+    def update(self, processed, unresolved, filename=None):
+        self.rows += len(processed)
+        self.unresolved_rows += int(unresolved.any(axis=1).sum())
+        self.cube.merge(RollupCube.from_frame(processed))
+
+        for column in unresolved.columns:
+            counts = processed.loc[unresolved[column], column].astype(str).value_counts()
+            if counts.empty:
+                continue
+            values = self.unresolved_values.setdefault(column, {})
+            for value, count in counts.items():
+                values[value] = values.get(value, 0) + int(count)
+        if filename is not None:
+            self.files[filename] = self.files.get(filename, 0) + len(processed)
+
+    def add_resolution(self, report):
+        # Airport values matched by the resolver, one row per value however many chunks it appeared in
+        if not report.empty:
+            self.resolution = combine_reports([self.resolution, report])
+
+    def merge(self, other):
+        # Combine totals built separately, e.g. one per file in a process pool
+        self.rows += other.rows
+        self.unresolved_rows += other.unresolved_rows
+        self.cube.merge(other.cube)
+        self.add_resolution(other.resolution)
+        for column, counts in other.unresolved_values.items():
+            values = self.unresolved_values.setdefault(column, {})
+            for value, count in counts.items():
+                values[value] = values.get(value, 0) + count
+        for filename, rows in other.files.items():
+            self.files[filename] = self.files.get(filename, 0) + rows
+        return self
+
+    def summary(self):
+        return {
+            "rows": self.rows,
+            "unresolved_rows": self.unresolved_rows,
+            "emissions": self.emissions,
+            "distance_km": self.distance_km,
+            "passenger_distance_pkm": self.passenger_distance_pkm,
+            "files": dict(self.files),
+        }
+
+
+def stream_emissions(files, airports, emission_factors, routes=None, chunksize=DEFAULT_CHUNKSIZE, on_chunk=None,
+                     resolver=None, min_confidence=DEFAULT_MIN_CONFIDENCE, model=None):
+    """Calculate emissions for binary CSV or Parquet files without holding any of them in memory whole.
+
+    Only the running totals and the first `PREVIEW_ROWS` processed rows are kept, so peak
+    memory follows `chunksize` rather than the size of the upload. `on_chunk` is called with
+    (filename, encoding or "parquet", processed chunk) after each chunk. With an `AirportResolver`,
+    unmatched airports in each chunk get a second pass (see `resolver.resolve_unresolved`).
+    """
+    totals = EmissionTotals()
+    preview = []
+    preview_rows = 0
+    for file in files:
+        name = os.path.basename(getattr(file, "name", str(file)))
+        file_format = sniff_format(file)
+        for chunk in iter_chunks(file, chunksize, file_format):
+            chunk["filename"] = name
+            processed, unresolved = calculate_emissions(chunk, airports, emission_factors, routes=routes, model=model)
+            if resolver is not None:
+                processed, unresolved, report = resolve_unresolved(
+                    processed, unresolved, resolver, airports, emission_factors, routes=routes,
+                    min_confidence=min_confidence, model=model,
+                )
+                totals.add_resolution(report)
+            totals.update(processed, unresolved, filename=name)
+            if preview_rows < PREVIEW_ROWS:
+                preview.append(processed.head(PREVIEW_ROWS - preview_rows))
+                preview_rows += len(preview[-1])
+            if on_chunk is not None:
+                on_chunk(name, file_format, processed)
+    preview = pd.concat(preview, ignore_index=True) if preview else pd.DataFrame()
+    return totals, preview
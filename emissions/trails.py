@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+from emissions import profiling
+from emissions.compact import airport_ids
+
+# Levels of detail for the emissions trail map; every level sends at most `limit` features to the browser
+LEVELS = {
+    "routes": "Top routes",
+    "countries": "Country to country",
+    "regions": "Region to region",
+    "hotspots": "Airport hotspots",
+}
+DEFAULT_LIMIT = 500
+
+# Continent of each ISO 3166 country code used in the Airports sheet
+REGIONS = {
+    "Africa": "AO BF BI BJ BW CD CF CG CI CM CV DJ DZ EG EH ER ET GA GH GM GN GQ GW IO KE KM LR LS LY MA MG ML MR "
+              "MU MW MZ NA NE NG RE RW SC SD SH SL SN SO SS ST SZ TD TG TN TZ UG YT ZA ZM ZW",
+    "Asia": "AE AF AM AZ BD BH BN BT CN CY GE HK ID IL IN IQ IR JO JP KG KH KP KR KW KZ LA LB LK MM MN MO MV MY NP "
+            "OM PH PK PS QA SA SG SY TH TJ TL TM TR TW UZ VN YE",
+    "Europe": "AD AL AT AX BA BE BG BY CH CZ DE DK EE ES FI FO FR GB GG GI GR HR HU IE IM IS IT JE KS LI LT LU LV MC "
+              "MD ME MK MT NL NO PL PT RO RS RU SE SI SJ SK SM UA VA XK",
+    "North America": "AG AI AW BB BL BM BQ BS BZ CA CR CU CW DM DO GD GL GP GT HN HT JM KN KY LC MF MQ MS MX NI PA "
+                     "PM PR SV SX TC TT US VC VG VI",
+    "South America": "AR BO BR CL CO EC FK GF GY PE PY SR UY VE",
+    "Oceania": "AS AU CC CK CX FJ FM GU KI MH MP NC NF NR NU NZ PF PG PN PW SB TK TO TV UM VU WF WS",
+    "Antarctica": "AQ GS TF",
+}
+COUNTRY_REGIONS = {country: region for region, countries in REGIONS.items() for country in countries.split()}
+
+
+def airport_places(airports, coordinates):
+    """Country and region of every airport in `coordinates`, in the same order."""
+    countries = airports.drop_duplicates("Lookup").set_index("Lookup")["Country"].reindex(coordinates.index)
+    return pd.DataFrame({
+        "Country": countries.fillna("Unknown").to_numpy(dtype=object),
+        "Region": countries.map(COUNTRY_REGIONS).fillna("Other").to_numpy(dtype=object),
+    }, index=coordinates.index)
+
+
+def route_emissions(frame, coordinates):
+    """Emissions summed per airport pair over the legs with known coordinates.
+
+    Groups on the integer airport ids, so compact and full frames give the same result.
+    """
+    ids = airport_ids(frame, coordinates)
+    origin, dest = ids["Origin_id"], ids["Destination_id"]
+    emissions = frame["Emissions"].to_numpy(dtype="float64", na_value=np.nan)
+    keep = (origin >= 0) & (dest >= 0) & ~np.isnan(emissions)
+    n = len(coordinates)
+    pairs, inverse = np.unique(origin[keep].astype("int64") * n + dest[keep], return_inverse=True)
+    return pd.DataFrame({
+        "origin": pairs // n,
+        "destination": pairs % n,
+        "Emissions": np.bincount(inverse.reshape(-1), weights=emissions[keep], minlength=len(pairs)),
+    })
+
+
+def scale_widths(values, low=1.0, high=6.0):
+    # Linear from `low` at the smallest value to `high` at the largest; a flat 2 when they are equal
+    values = np.asarray(values, dtype="float64")
+    if len(values) == 0:
+        return values
+    span = values.max() - values.min()
+    if span <= 0:
+        return np.full(len(values), 2.0)
+    return low + (high - low) * (values - values.min()) / span
+
+
+def format_emissions(values):
+    return np.char.mod("%.4f", np.asarray(values, dtype="float64"))
+
+
+def _group_centres(group_codes, groups, lat, lon, weights):
+    # Emission-weighted centre of the airports each group's legs actually use
+    total = np.bincount(group_codes, weights=weights, minlength=groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centre_lat = np.bincount(group_codes, weights=weights * lat, minlength=groups) / total
+        centre_lon = np.bincount(group_codes, weights=weights * lon, minlength=groups) / total
+    return centre_lat, centre_lon
+
+
+def _arcs(routes, coordinates, places, level):
+    lat = coordinates["Lat"].to_numpy(dtype="float64")
+    lon = coordinates["Lon"].to_numpy(dtype="float64")
+    origin = routes["origin"].to_numpy()
+    dest = routes["destination"].to_numpy()
+    emissions = routes["Emissions"].to_numpy()
+    if level == "routes":
+        return pd.DataFrame({
+            "Origin": coordinates.index[origin], "Destination": coordinates.index[dest],
+            "Origin_Lat": lat[origin], "Origin_Lon": lon[origin],
+            "Destination_Lat": lat[dest], "Destination_Lon": lon[dest],
+            "Emissions": emissions,
+        })
+
+    column = "Country" if level == "countries" else "Region"
+    codes, labels = pd.factorize(places[column].to_numpy())
+    origin_group, dest_group = codes[origin], codes[dest]
+    groups = len(labels)
+    # Both ends of a leg pull their group's centre towards the airport, weighted by emissions
+    ends = np.concatenate([origin, dest])
+    centre_lat, centre_lon = _group_centres(
+        codes[ends], groups, lat[ends], lon[ends], np.concatenate([emissions, emissions]) + 1e-9
+    )
+    pairs, inverse = np.unique(origin_group.astype("int64") * groups + dest_group, return_inverse=True)
+    from_group, to_group = pairs // groups, pairs % groups
+    return pd.DataFrame({
+        "Origin": labels[from_group], "Destination": labels[to_group],
+        "Origin_Lat": centre_lat[from_group], "Origin_Lon": centre_lon[from_group],
+        "Destination_Lat": centre_lat[to_group], "Destination_Lon": centre_lon[to_group],
+        "Emissions": np.bincount(inverse.reshape(-1), weights=emissions, minlength=len(pairs)),
+    })
+
+
+def _hotspots(routes, coordinates):
+    # Emissions of every flight to or from each airport
+    ends = np.concatenate([routes["origin"].to_numpy(), routes["destination"].to_numpy()])
+    emissions = np.bincount(ends, weights=np.tile(routes["Emissions"].to_numpy(), 2), minlength=len(coordinates))
+    used = np.flatnonzero(emissions)
+    return pd.DataFrame({
+        "Airport": coordinates.index[used],
+        "Lat": coordinates["Lat"].to_numpy(dtype="float64")[used],
+        "Lon": coordinates["Lon"].to_numpy(dtype="float64")[used],
+        "Emissions": emissions[used],
+    })
+
+
+def map_layer_data(frame, coordinates, places, level="routes", limit=DEFAULT_LIMIT):
+    """The rows to draw on the trail map at `level`, largest emissions first and at most `limit` of them.
+
+    Returns the features and the summary `{"features", "shown", "emissions", "shown_emissions"}` so the
+    page can say how much of the total the capped map covers. Arcs get `width` and hotspots `radius`,
+    both scaled to the shown features, plus a preformatted `Emissions_str` for the tooltip.
+    """
+    with profiling.stage(f"trails.{level}", rows=len(frame)):
+        routes = route_emissions(frame, coordinates)
+        if level == "hotspots":
+            features = _hotspots(routes, coordinates)
+        else:
+            features = _arcs(routes, coordinates, places, level)
+            if level != "routes":
+                # Legs within one country or region have no arc to draw
+                features = features[features["Origin"] != features["Destination"]]
+        total = float(features["Emissions"].sum())
+        count = len(features)
+        features = features.nlargest(limit, "Emissions").reset_index(drop=True)
+        if level == "hotspots":
+            features["radius"] = 20_000 + 180_000 * np.sqrt(scale_widths(features["Emissions"], 0.0, 1.0))
+        else:
+            features["width"] = scale_widths(features["Emissions"])
+        features["Emissions_str"] = format_emissions(features["Emissions"])
+    summary = {
+        "features": count,
+        "shown": len(features),
+        "emissions": total,
+        "shown_emissions": float(features["Emissions"].sum()),
+    }
+    return features, summary
@@ -1,7 +1,5 @@
 import streamlit as st
 from ui.layout import set_page_config
-from pathlib import Path
-import pandas as pd
 
 set_page_config()
 
@@ -11,6 +9,12 @@ pages =[
     st.Page("data.py", title="Background data", icon=":material/database:")
 ]
 
+st.sidebar.toggle(
+    "Diagnostics",
+    key="diagnostics",
+    help="Show per-stage timings, rows/s, bytes read and peak memory of the last runs. Tracing memory slows the calculation down."
+)
+
 pg = st.navigation(pages)
 pg.run()
 
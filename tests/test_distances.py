@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from emissions.distances import distance_model, haversine_km, vincenty_km
+
+# Geodesic distances on WGS-84 from GeographicLib (Karney's method), in km
+REFERENCE = [
+    # Flinders Peak to Buninyong, the worked example of Vincenty (1975)
+    ((-37.95103341666667, 144.42486788888888, -37.65282113888889, 143.92649552777777), 54.972271139),
+    ((51.47, -0.45, 40.64, -73.78), 5555.408658),  # LHR to JFK
+    ((90, 0, -90, 0), 20003.931458625),  # pole to pole
+    ((0, 0, 0, 180), 20003.931458625),  # antipodes on the equator
+    ((0, 0, 0, 179.0), 19926.188851996),
+    # Near-antipodal pairs on or mirrored across the equator, where Vincenty's iteration fails
+    ((0, 0, 0, 179.5), 19980.861908891),
+    ((1, 0, -1, 179.5), 19980.861908891),
+    ((0.1, 0, -0.1, 179.8), 20000.239437725),
+    ((0, 0, 0.5, 179.7), 19944.127420750),
+    ((10, 0, -10.2, 179.9), 19981.121597811),
+    ((30, 0, -29.9, 179.8), 19989.832827610),
+    ((0, 0, 1e-7, 180), 20003.931447568),
+]
+
+
+@pytest.mark.parametrize("points, expected", REFERENCE)
+def test_vincenty_matches_reference(points, expected):
+    assert vincenty_km(*points) == pytest.approx(expected, abs=1e-6)
+
+
+def test_vincenty_is_symmetric_and_vectorized():
+    points = np.array([points for points, _ in REFERENCE], dtype="float64").T
+    expected = np.array([expected for _, expected in REFERENCE])
+    forward = vincenty_km(*points)
+    backward = vincenty_km(points[2], points[3], points[0], points[1])
+    np.testing.assert_allclose(forward, expected, atol=1e-6, rtol=0)
+    np.testing.assert_allclose(backward, expected, atol=1e-6, rtol=0)
+
+
+def test_vincenty_never_exceeds_the_half_meridian():
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(-90, 90, 10_000)
+    lon = rng.uniform(-180, 180, 10_000)
+    # Points scattered within a degree of each other's antipode
+    distance = vincenty_km(lat, lon, -lat + rng.normal(0, 1, 10_000).clip(-1, 1), lon + 180 + rng.normal(0, 1, 10_000))
+    assert not np.isnan(distance).any()
+    assert distance.max() <= 20003.931458625 + 1e-6
+
+
+def test_coincident_points_are_zero():
+    assert vincenty_km(51.47, -0.45, 51.47, -0.45) == 0
+    assert haversine_km(51.47, -0.45, 51.47, -0.45) == 0
+
+
+def test_defra_uplift():
+    points = (51.47, -0.45, 40.64, -73.78)
+    assert distance_model("vincenty+defra").distance_km(*points) == pytest.approx(vincenty_km(*points) * 1.08)
+    assert distance_model("haversine+defra").distance_km(*points) == pytest.approx(haversine_km(*points) * 1.08)
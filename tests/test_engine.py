@@ -0,0 +1,102 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from emissions.engine import OUTPUT_COLUMNS, calculate_emissions
+from emissions.reference import SHEETS, WORKBOOK_PATH
+
+SAMPLE_PATH = WORKBOOK_PATH.parent / "sample data.csv"
+
+
+@pytest.fixture(scope="module")
+def reference():
+    with pd.ExcelFile(WORKBOOK_PATH) as workbook:
+        return {name: workbook.parse(**options) for name, options in SHEETS.items()}
+
+
+def loop_emissions(business_data, airports, emission_factors):
+    # The per-row loop the calculator page ran before the vectorized engine, without its st.error calls
+    airports_indexed = airports.set_index("Lookup")
+    factors_indexed = emission_factors.set_index("Class")
+
+    def get_coordinate(origin, destination):
+        origin_row = airports_indexed.loc[[origin]] if origin in airports_indexed.index else None
+        dest_row = airports_indexed.loc[[destination]] if destination in airports_indexed.index else None
+        if origin_row is None or dest_row is None:
+            return None, None, None, None
+        return origin_row["Lat"].values[0], origin_row["Lon"].values[0], dest_row["Lat"].values[0], dest_row["Lon"].values[0]
+
+    def get_emission_factor(fly_class):
+        try:
+            return factors_indexed.at[fly_class, "Factor CO2e Value"]
+        except KeyError:
+            return None
+
+    def calculate_distance(origin_lat, origin_lon, dest_lat, dest_lon, is_return=False):
+        origin_lat, origin_lon, dest_lat, dest_lon = map(math.radians, [origin_lat, origin_lon, dest_lat, dest_lon])
+        a = math.sin((dest_lat - origin_lat) / 2) ** 2 + math.cos(origin_lat) * math.cos(dest_lat) * math.sin((dest_lon - origin_lon) / 2) ** 2
+        distance = 6371 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+        return distance * 2 if is_return else distance
+
+    business_data = business_data.copy()
+    columns = {name: [] for name in ["Emission_Factor", "Distance_km", "Emissions", "Origin_Lat", "Origin_Lon", "Destination_Lat", "Destination_Lon"]}
+    for row in business_data.itertuples(index=False):
+        row_dict = row._asdict()
+        num_passengers = row_dict.get("Num_Passengers", 1) or row_dict.get("Num Passengers", 1)
+        is_return = str(getattr(row, "Return_trip", "")).strip().lower() == "return"
+        coordinates = get_coordinate(row.Origin, row.Destination)
+        emission_factor = get_emission_factor(row.Class)
+        for name, value in zip(["Origin_Lat", "Origin_Lon", "Destination_Lat", "Destination_Lon"], coordinates):
+            columns[name].append(value)
+        if all(value is not None and not pd.isna(value) for value in [*coordinates, emission_factor]):
+            distance = calculate_distance(*coordinates, is_return=is_return)
+            columns["Distance_km"].append(distance)
+            columns["Emission_Factor"].append(emission_factor)
+            columns["Emissions"].append(distance * num_passengers * emission_factor)
+        else:
+            columns["Distance_km"].append(None)
+            columns["Emission_Factor"].append(None)
+            columns["Emissions"].append(None)
+    for name, values in columns.items():
+        business_data[name] = pd.to_numeric(pd.Series(values, index=business_data.index, dtype=object))
+    business_data["Passenger_distance_pkm"] = business_data["Distance_km"] * business_data["Num_Passengers"]
+    return business_data
+
+
+def assert_same_output(business_data, reference):
+    expected = loop_emissions(business_data, reference["airports"], reference["emission_factors"])
+    processed, _ = calculate_emissions(business_data, reference["airports"], reference["emission_factors"])
+    pd.testing.assert_frame_equal(processed[expected.columns], expected, check_dtype=False, rtol=1e-12)
+    assert set(OUTPUT_COLUMNS) <= set(processed.columns)
+
+
+def test_sample_matches_the_row_loop(reference):
+    assert_same_output(pd.read_csv(SAMPLE_PATH), reference)
+
+
+def test_edge_rows_match_the_row_loop(reference):
+    business_data = pd.DataFrame({
+        "Origin": ["IXE", "IXE", "IXE", "IXE", "IXE", "XXX", "IXE", "Sydney"],
+        "Destination": ["Sydney", "Sydney", "Sydney", "Sydney", "Sydney", "Sydney", "Sydney", "IXE"],
+        "Class": ["Economy", "Business", "Economy", "Economy", "Economy", "Economy", "Sleeper", "Average"],
+        "Num_Passengers": [0, np.nan, 2, 3, 1.5, 1, 1, 2],
+        "Return_trip": ["Return", "Return", " return ", "RETURN", "One-Way", "Return", None, np.nan],
+    })
+    assert_same_output(business_data, reference)
+
+
+def test_unresolved_mask(reference):
+    business_data = pd.DataFrame({
+        "Origin": ["IXE", "XXX", "IXE"],
+        "Destination": ["Sydney", "Sydney", "Nowhere"],
+        "Class": ["Economy", "Sleeper", "Economy"],
+        "Num_Passengers": [1, 1, 1],
+    })
+    _, unresolved = calculate_emissions(business_data, reference["airports"], reference["emission_factors"])
+    assert unresolved.to_dict("list") == {
+        "Origin": [False, True, False],
+        "Destination": [False, False, True],
+        "Class": [False, True, False],
+    }
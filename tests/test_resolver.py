@@ -0,0 +1,127 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from emissions.engine import calculate_emissions
+from emissions.ingest import read_file
+from emissions.resolver import DEFAULT_MIN_CONFIDENCE, AirportResolver, read_aliases, resolve_unresolved
+
+AIRPORTS = pd.DataFrame({
+    "Lookup": ["LHR", "JFK", "SIN", "Sydney", "Sydney", "JOS", "Jos"],
+    "Name": ["London Heathrow Airport", "John F Kennedy International Airport", "Singapore Changi Airport",
+             "Sydney Kingsford Smith Airport", "Sydney Bankstown Airport", "Yakubu Gowon Airport", None],
+    "Lat": [51.47, 40.64, 1.36, -33.95, -33.92, 9.64, 9.64],
+    "Lon": [-0.45, -73.78, 103.99, 151.18, 150.99, 8.87, 8.87],
+})
+EMISSION_FACTORS = pd.DataFrame({"Class": ["Economy", "Business"], "Factor CO2e Value": [0.15, 0.43]})
+
+
+@pytest.fixture(scope="module")
+def resolver():
+    return AirportResolver(AIRPORTS)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("LHR", ("LHR", "exact", 1.0)),
+    (" sydney ", ("Sydney", "normalized", 1.0)),
+    ("SYDNEY", ("Sydney", "normalized", 1.0)),
+    ("jos", ("JOS", "ambiguous", 0.9)),
+    ("London Heathrow", ("LHR", "name", 0.95)),
+    ("london heathrow airport", ("LHR", "name", 0.95)),
+    ("Changi", ("SIN", "contained", 0.9)),
+    ("LHX", (None, "unmatched", 0.0)),  # too short to be anything but another code
+    ("Bankstown", (None, "unmatched", 0.0)),  # second airport under the Sydney Lookup
+])
+def test_match(resolver, value, expected):
+    assert resolver.match(value) == expected
+
+
+def test_fuzzy_match_below_threshold_is_suggested_only(resolver):
+    lookup, method, confidence = resolver.match("Hethrow")
+    assert (lookup, method) == ("LHR", "fuzzy") and confidence < DEFAULT_MIN_CONFIDENCE
+    report = resolver.resolve(pd.Series(["Hethrow", "Londn Heathro", None]))
+    assert report.loc["Hethrow", "Match"] == "LHR" and not report.loc["Hethrow", "Accepted"]
+    assert report.loc["Londn Heathro", "Method"] == "fuzzy" and report.loc["Londn Heathro", "Accepted"]
+    assert resolver.resolve(pd.Series(["Hethrow"]), min_confidence=0.5).loc["Hethrow", "Accepted"]
+
+
+def test_aliases(resolver):
+    aliased = resolver.with_aliases({"Big Apple": "JFK", "Lion City": "singapore changi", "Narnia": "XXX"})
+    assert aliased.match("big  apple") == ("JFK", "alias", 1.0)
+    assert aliased.match("Lion City") == ("SIN", "alias", 1.0)
+    assert aliased.invalid_aliases == {"Narnia": "XXX"}
+    # The shared index is untouched
+    assert resolver.match("Big Apple") == (None, "unmatched", 0.0)
+
+
+@pytest.mark.parametrize("text", ["Big Apple,JFK\nHeathrow Intl,LHR\n", "Alias,Lookup\nBig Apple, JFK\nHeathrow Intl,LHR\n"])
+def test_read_aliases(text):
+    assert read_aliases(io.StringIO(text)) == {"Big Apple": "JFK", "Heathrow Intl": "LHR"}
+
+
+def test_read_aliases_needs_two_columns():
+    with pytest.raises(ValueError):
+        read_aliases(io.StringIO("Big Apple\n"))
+
+
+def test_resolve_unresolved_rewrites_accepted_rows(resolver):
+    business_data = pd.DataFrame({
+        "Origin": ["LHR", " sydney ", "Hethrow", "London Heathrow", "LHR"],
+        "Destination": ["JFK", "LHR", "JFK", "Changi", "Atlantis"],
+        "Class": ["Economy", "Business", "Economy", "Economy", "Economy"],
+        "Num_Passengers": [1, 2, 1, 1, 1],
+    })
+    processed, unresolved = calculate_emissions(business_data, AIRPORTS, EMISSION_FACTORS)
+    before = processed.copy()
+    resolved, still_unresolved, report = resolve_unresolved(processed, unresolved, resolver, AIRPORTS, EMISSION_FACTORS)
+
+    assert resolved["Origin"].tolist() == ["LHR", "Sydney", "Hethrow", "LHR", "LHR"]
+    assert resolved["Destination"].tolist() == ["JFK", "LHR", "JFK", "SIN", "Atlantis"]
+    expected, _ = calculate_emissions(resolved[business_data.columns], AIRPORTS, EMISSION_FACTORS)
+    pd.testing.assert_frame_equal(resolved, expected)
+    assert still_unresolved.to_dict("list") == {
+        "Origin": [False, False, True, False, False],
+        "Destination": [False, False, False, False, True],
+        "Class": [False] * 5,
+    }
+    # The frames passed in may be cached and shared, so they are left as they were
+    pd.testing.assert_frame_equal(processed, before)
+    assert unresolved["Origin"].sum() == 3
+
+    report = report.set_index(["Column", "Value"])
+    assert report.loc[("Origin", "Hethrow"), "Accepted"] == np.False_
+    assert report.loc[("Destination", "Atlantis"), "Method"] == "unmatched"
+    assert report.loc[("Origin", " sydney "), ["Match", "Rows", "Accepted"]].tolist() == ["Sydney", 1, True]
+
+
+def test_resolve_unresolved_without_matches_returns_inputs(resolver):
+    business_data = pd.DataFrame({"Origin": ["LHR"], "Destination": ["Atlantis"], "Class": ["Economy"]})
+    processed, unresolved = calculate_emissions(business_data, AIRPORTS, EMISSION_FACTORS)
+    result, result_unresolved, report = resolve_unresolved(processed, unresolved, resolver, AIRPORTS, EMISSION_FACTORS)
+    assert result is processed and result_unresolved is unresolved
+    assert report["Value"].tolist() == ["Atlantis"]
+
+
+def test_resolve_unresolved_keeps_categorical_columns(resolver):
+    # Parquet written by pandas, such as the app's compact export, reads back categorical airport columns
+    business_data = pd.DataFrame({
+        "Origin": pd.Categorical(["LHR", " sydney ", "London Heathrow"]),
+        "Destination": pd.Categorical(["JFK", "LHR", "Changi"]),
+        "Class": ["Economy", "Business", "Economy"],
+    })
+    buffer = io.BytesIO()
+    business_data.to_parquet(buffer)
+    business_data = read_file(buffer)
+    assert isinstance(business_data["Origin"].dtype, pd.CategoricalDtype)
+
+    processed, unresolved = calculate_emissions(business_data, AIRPORTS, EMISSION_FACTORS)
+    resolved, still_unresolved, _ = resolve_unresolved(processed, unresolved, resolver, AIRPORTS, EMISSION_FACTORS)
+    assert isinstance(resolved["Origin"].dtype, pd.CategoricalDtype)
+    assert resolved["Origin"].tolist() == ["LHR", "Sydney", "LHR"]
+    assert resolved["Destination"].tolist() == ["JFK", "LHR", "SIN"]
+    assert not still_unresolved.any(axis=None)
+    plain = business_data.astype({"Origin": object, "Destination": object})
+    expected, _, _ = resolve_unresolved(*calculate_emissions(plain, AIRPORTS, EMISSION_FACTORS), resolver, AIRPORTS, EMISSION_FACTORS)
+    np.testing.assert_allclose(resolved["Emissions"], expected["Emissions"])
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from emissions.rollup import AGGREGATIONS, MAX_TAG_VALUES, SKETCH_ACCURACY, RollupCube
+
+MEASURES = ["Distance_km", "Emissions"]
+
+
+@pytest.fixture(scope="module")
+def frame():
+    rng = np.random.default_rng(0)
+    rows = 20_000
+    frame = pd.DataFrame({
+        "Class": rng.choice(["Economy", "Business", "First", None], rows, p=[0.6, 0.2, 0.1, 0.1]),
+        "Origin": rng.choice([f"A{i}" for i in range(50)], rows),
+        "Project": rng.choice(["Alpha", "Beta", None], rows),
+        "Distance_km": rng.lognormal(7, 1, rows),
+        "Emissions": rng.lognormal(5, 2, rows),
+    })
+    frame.loc[rng.random(rows) < 0.05, "Emissions"] = np.nan  # unpriced rows
+    frame.loc[frame["Origin"] == "A7", "Emissions"] = np.nan  # a group with no priced rows at all
+    return frame
+
+
+def split(frame, chunks):
+    return [frame.iloc[rows] for rows in np.array_split(np.arange(len(frame)), chunks)]
+
+
+def chunked_cube(frame, chunks):
+    cube = RollupCube()
+    for chunk in split(frame, chunks):
+        cube.merge(RollupCube.from_frame(chunk))
+    return cube
+
+
+def expected(frame, dimension, measure, aggregation):
+    result = frame.groupby(dimension, dropna=False)[measure].agg(aggregation)
+    return result.rename(measure).rename_axis(dimension)
+
+
+@pytest.mark.parametrize("chunks", [1, 7])
+@pytest.mark.parametrize("dimension", ["Class", "Origin", "Project"])
+def test_aggregates_match_groupby(frame, chunks, dimension):
+    cube = RollupCube.from_frame(frame) if chunks == 1 else chunked_cube(frame, chunks)
+    assert cube.rows == len(frame)
+    for measure in MEASURES:
+        for aggregation in AGGREGATIONS:
+            result = cube.aggregate(dimension, measure, aggregation, dropna=False)
+            reference = expected(frame, dimension, measure, aggregation)
+            # Medians come from the bucket sketch, everything else is exact
+            rtol = SKETCH_ACCURACY if aggregation == "median" else 1e-9
+            pd.testing.assert_series_equal(result, reference, check_index_type=False, rtol=rtol)
+
+
+def test_merged_cube_matches_single_frame(frame):
+    single, merged = RollupCube.from_frame(frame), chunked_cube(frame, 5)
+    assert sorted(merged.dimensions) == sorted(single.dimensions)
+    pd.testing.assert_series_equal(merged.totals, single.totals, rtol=1e-9)
+    for dimension in single.dimensions:
+        pd.testing.assert_frame_equal(
+            merged.summary(dimension).sort_values(dimension, ignore_index=True),
+            single.summary(dimension).sort_values(dimension, ignore_index=True),
+            rtol=1e-9,
+        )
+
+
+def test_tag_dropped_once_merged_past_the_limit(frame):
+    # Each chunk has few enough trip IDs to be a dimension, together they are too many
+    chunks = split(frame.assign(Trip=[f"T{i}" for i in range(len(frame))]), 40)
+    assert all(chunk["Trip"].nunique() <= MAX_TAG_VALUES for chunk in chunks)
+    cube = RollupCube()
+    for chunk in chunks:
+        cube.merge(RollupCube.from_frame(chunk))
+    assert "Trip" not in cube.dimensions and "Trip" not in cube.sketches
+    assert cube.skipped == {"Trip"}
+    # The other dimensions are unaffected
+    pd.testing.assert_series_equal(
+        cube.aggregate("Class", "Distance_km", dropna=False), expected(frame, "Class", "Distance_km", "sum"),
+        check_index_type=False, rtol=1e-9,
+    )
+
+
+def test_skipped_tag_stays_skipped_in_either_merge_order(frame):
+    wide = RollupCube.from_frame(frame.assign(Trip=[f"T{i}" for i in range(len(frame))]))
+    narrow = RollupCube.from_frame(frame.assign(Trip="T0"))
+    assert wide.skipped == {"Trip"} and "Trip" in narrow.dimensions
+    assert "Trip" not in RollupCube().merge(narrow).merge(wide).dimensions
+    assert "Trip" not in RollupCube().merge(wide).merge(narrow).dimensions
+
+
+def test_core_dimensions_are_never_skipped():
+    origins = [f"O{i}" for i in range(MAX_TAG_VALUES + 1)]
+    cube = RollupCube.from_frame(pd.DataFrame({"Origin": origins, "Emissions": 1.0}))
+    assert "Origin" in cube.dimensions and not cube.skipped
@@ -0,0 +1,52 @@
+import json
+
+import pandas as pd
+import streamlit as st
+
+
+def diagnostics_enabled():
+    # Sidebar toggle from main.py; it also turns on per-stage peak memory tracing
+    return st.session_state.get("diagnostics", False)
+
+
+def record_profile(profiler):
+    """Keep the finished run's report for the diagnostics panel and write it to the structured log."""
+    profiler.log()
+    st.session_state.setdefault("profiles", {})[profiler.name] = profiler.report()
+
+
+def diagnostics_panel():
+    profiles = st.session_state.get("profiles", {})
+    if not diagnostics_enabled() or not profiles:
+        return
+    st.divider()
+    st.write("""#### Diagnostics""")
+    for name, report in profiles.items():
+        with st.expander(f"{name}: {report['elapsed_s']:.3f} s, started {report['started']}", icon=":material/speed:"):
+            stages = pd.DataFrame(report["stages"])
+            if not stages.empty:
+                stages["MB"] = pd.to_numeric(stages["bytes"]) / 1e6
+                stages["Peak MB"] = pd.to_numeric(stages["peak_bytes"]) / 1e6
+                st.dataframe(
+                    stages[["stage", "calls", "seconds", "rows", "rows_per_s", "MB", "mb_per_s", "Peak MB"]],
+                    hide_index=True,
+                    column_config={
+                        "seconds": st.column_config.NumberColumn("Seconds", format="%.4f"),
+                        "rows_per_s": st.column_config.NumberColumn("Rows/s", format="%.0f"),
+                        "MB": st.column_config.NumberColumn(format="%.2f"),
+                        "mb_per_s": st.column_config.NumberColumn("MB/s", format="%.1f"),
+                        "Peak MB": st.column_config.NumberColumn(format="%.1f"),
+                    },
+                )
+            if report["counters"]:
+                st.json(report["counters"])
+            if report["max_rss_bytes"]:
+                st.caption(f"Process peak resident memory: {report['max_rss_bytes'] / 1e6:,.0f} MB")
+            st.download_button(
+                "Download JSON",
+                data=json.dumps(report, indent=2),
+                file_name=f"profile-{name.replace(' ', '_')}.json",
+                mime="application/json",
+                key=f"profile-{name}",
+                icon=":material/download:",
+            )
@@ -1,7 +1,110 @@
+import weakref
+
+import numpy as np
+import pandas as pd
 import streamlit as st
 
-def table(data, title="Table title", subtitle="Table subtitle"):
-    st.subheader(title)
-    st.write(subtitle)
-    st.caption(f"This table contains {len(data.iloc[:,0])} rows")
-    st.dataframe(data)
+# Tables longer than this are paged: only the visible window is sent to the browser
+PAGED_MIN_ROWS = 1_000
+PAGE_SIZES = [50, 100, 500, 1_000]
+
+
+def filter_positions(data, query):
+    """Positions of the rows where any text column contains `query` (case-insensitive)."""
+    if not query:
+        return np.arange(len(data))
+    needle = query.casefold()
+    matched = np.zeros(len(data), dtype=bool)
+    for column in data.columns:
+        values = data[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Match each category once instead of every row
+            hits = np.array([needle in str(category).casefold() for category in values.cat.categories], dtype=bool)
+            codes = values.cat.codes.to_numpy()
+            matched |= (codes >= 0) & np.append(hits, False)[codes]
+        else:
+            text = values.astype("string").str.casefold()
+            matched |= text.str.contains(needle, regex=False).fillna(False).to_numpy(dtype=bool)
+    return np.flatnonzero(matched)
+
+
+def sort_positions(data, positions, column, descending=False):
+    if column is None:
+        return positions
+    values = data[column].iloc[positions].reset_index(drop=True)
+    order = values.sort_values(ascending=not descending, kind="stable", na_position="last").index.to_numpy()
+    return positions[order]
+
+
+def summary_stats(data, positions):
+    # Count, sum, mean and range of the numeric columns over the matching rows
+    numeric = data.select_dtypes(include="number")
+    if numeric.empty:
+        return None
+    stats = {}
+    for column in numeric.columns:
+        values = numeric[column].to_numpy(dtype="float64", na_value=np.nan)[positions]
+        present = values[~np.isnan(values)]
+        stats[column] = {
+            "count": len(present),
+            "sum": present.sum(),
+            "mean": present.mean() if len(present) else np.nan,
+            "min": present.min() if len(present) else np.nan,
+            "max": present.max() if len(present) else np.nan,
+        }
+    return pd.DataFrame(stats).T
+
+
+def _view(data, key, query, sort, descending):
+    # Filtered and sorted positions, kept per table until the data or the controls change
+    state = st.session_state.get(f"{key}-view")
+    if state is not None and state["data"]() is data and state["controls"] == (query, sort, descending):
+        return state["positions"], state["stats"]
+    positions = sort_positions(data, filter_positions(data, query), sort, descending)
+    stats = summary_stats(data, positions)
+    st.session_state[f"{key}-view"] = {
+        "data": weakref.ref(data), "controls": (query, sort, descending), "positions": positions, "stats": stats,
+    }
+    return positions, stats
+
+
+def paged_table(data, key, format_page=None):
+    """Show `data` one page at a time, filtering and sorting on the server.
+
+    `format_page`, if given, is applied to the visible window only, e.g. to expand a compact frame.
+    """
+    search, sort, order, size = st.columns([3, 2, 1, 1])
+    query = search.text_input("Search", key=f"{key}-query", placeholder="Filter rows containing…")
+    sort_column = sort.selectbox("Sort by", list(data.columns), index=None, key=f"{key}-sort", placeholder="Original order")
+    descending = order.toggle("Descending", key=f"{key}-descending")
+    page_size = size.selectbox("Rows per page", PAGE_SIZES, index=1, key=f"{key}-size")
+
+    positions, stats = _view(data, key, query.strip(), sort_column, descending)
+    pages = max(1, -(-len(positions) // page_size))
+    if st.session_state.get(f"{key}-page", 1) > pages:
+        st.session_state[f"{key}-page"] = pages
+    page = st.number_input("Page", min_value=1, max_value=pages, step=1, key=f"{key}-page")
+
+    start = (page - 1) * page_size
+    window = data.iloc[positions[start:start + page_size]]
+    if format_page is not None:
+        window = format_page(window)
+    st.dataframe(window)
+    shown = f"rows {start + 1:,}–{start + len(window):,}" if len(window) else "no rows"
+    st.caption(f"Page {page:,} of {pages:,}: {shown} of {len(positions):,} matching ({len(data):,} total)")
+    if stats is not None:
+        # A popover rather than an expander so paged tables can sit inside expanders
+        with st.popover("Summary of matching rows", icon=":material/functions:"):
+            st.dataframe(stats)
+
+
+def table(data, title="Table title", subtitle="Table subtitle", key=None, format_page=None):
+    if title is not None:
+        st.subheader(title)
+    if subtitle is not None:
+        st.write(subtitle)
+    st.caption(f"This table contains {len(data):,} rows")
+    if len(data) > PAGED_MIN_ROWS:
+        paged_table(data, key or title, format_page)
+    else:
+        st.dataframe(data if format_page is None else format_page(data))